@@ -0,0 +1,150 @@
+"""
+Offline benchmark of the app's pages and writes against fake_sheets.py.
+
+    python benchmark.py
+    python benchmark.py --sizes 1000 --latency 0.05 --quota 300
+
+It first checks the app's import time against STARTUP_TIME_BUDGET and
+exits with status 1 if it is over. For every roster size it then reports
+the Sheets API calls and the median wall time of each operation. Cold runs
+start with every cache dropped and warm runs reuse the loaded snapshot.
+Page functions run in Streamlit's bare mode, so widgets keep their
+defaults and nothing is drawn.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ["SHEETS_BACKEND"] = "fake"
+os.environ.setdefault("FAKE_SHEETS_STUDENTS", "0")
+
+# Bare-mode Streamlit warns on every widget
+logging.disable(logging.WARNING)
+
+import fake_sheets
+import newstudentmanagement as app
+
+def measure_startup():
+    """Seconds a fresh interpreter takes to import the app once Streamlit is loaded
+
+    The Streamlit server has already imported streamlit when it first runs
+    the script, so only the app's own imports and setup count.
+    """
+    code = ("import logging, time; logging.disable(logging.WARNING); import streamlit; "
+            "started = time.perf_counter(); import newstudentmanagement; "
+            "print(time.perf_counter() - started)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ))
+    return float(output.stdout.strip().splitlines()[-1])
+
+def measure(client, operation, repeat):
+    """Median seconds and mean API calls of running operation(i) for i in range(repeat)"""
+    timings = []
+    calls = 0
+    quota_errors = 0
+    for i in range(repeat):
+        client.reset_calls()
+        started = time.perf_counter()
+        operation(i)
+        timings.append(time.perf_counter() - started)
+        quota_errors += client.calls.pop("quota_errors", 0)
+        calls += sum(client.calls.values())
+    return statistics.median(timings), calls / repeat, quota_errors
+
+def cold(function):
+    """Run function with the sheet caches and the roster snapshot dropped"""
+    def run(_):
+        app.invalidate_sheet_cache()
+        app.invalidate_roster_snapshot()
+        function()
+    return run
+
+def benchmark_size(size, args):
+    client = fake_sheets.FakeClient()
+    client.seed({"IELTS": app.IELTS_SHEET_LINK, "Aptis": app.APTIS_SHEET_LINK}, app.STUDENT_HEADERS,
+                batches=min(args.batches, max(size, 1)), students=size)
+    fake_sheets.use_client(client)
+    # Pace calls only when simulating a quota, so timings measure the app
+    app.SHEETS_RATE_LIMIT = args.quota
+    app.st.cache_resource.clear()
+
+    # Latency and quota only apply once the roster is seeded
+    client.latency = args.latency
+    client.quota_per_minute = args.quota or None
+
+    snapshot = app.load_roster_snapshot()
+    students = snapshot.students
+    batch_name = students[0].batch_name
+
+    def add(i):
+        app.add_student_to_batch({"name": f"Benchmark {i}", "student_id": f"BENCH{i:06d}", "contact": "0170000000",
+                                  "email": f"bench{i}@example.com", "time": "4pm", "year": 2025}, batch_name)
+
+    def edit(i):
+        snapshot = app.load_roster_snapshot()
+        student = students[i]
+        app.update_student(student.row, student.batch_name, {"Student Name": f"Edited {i}"},
+                           student.student_id, snapshot.row_index.version(student.batch_name))
+
+    def delete(i):
+        snapshot = app.load_roster_snapshot()
+        student = students[-1 - i]
+        app.delete_student(student.row, student.batch_name, student.student_id,
+                           snapshot.row_index.version(student.batch_name))
+
+    operations = [
+        ("show_home_page (cold)", cold(app.show_home_page)),
+        ("show_home_page (warm)", lambda _: app.show_home_page()),
+        ("show_find_student_page (warm)", lambda _: app.show_find_student_page()),
+        ("search", lambda i: app.load_roster_snapshot().search(f"Student {i + 1}")),
+        ("add student", add),
+        ("edit student", edit),
+        ("delete student", delete)
+    ]
+
+    results = []
+    for name, operation in operations:
+        seconds, calls, quota_errors = measure(client, operation, args.repeat)
+        results.append({"students": size, "operation": name, "api_calls": calls,
+                        "median_ms": round(seconds * 1000, 2), "quota_errors": quota_errors})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma-separated student counts")
+    parser.add_argument("--batches", type=int, default=80, help="worksheets the students are spread over")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--quota", type=int, default=0, help="API calls allowed per minute (0 = unlimited)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per operation")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Best of a few runs, so a busy machine does not fail the budget
+    startup = min(measure_startup() for _ in range(3))
+    within_budget = startup <= app.STARTUP_TIME_BUDGET
+    print(f"startup: {startup * 1000:.0f} ms (budget {app.STARTUP_TIME_BUDGET * 1000:.0f} ms)"
+          f"{'' if within_budget else ' OVER BUDGET'}\n")
+
+    results = [{"operation": "startup", "seconds": round(startup, 4), "budget": app.STARTUP_TIME_BUDGET}]
+    print(f"{'students':>9}  {'operation':<30} {'api calls':>9} {'median ms':>10} {'429s':>5}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        for result in benchmark_size(size, args):
+            results.append(result)
+            print(f"{result['students']:>9}  {result['operation']:<30} {result['api_calls']:>9.1f} "
+                  f"{result['median_ms']:>10.2f} {result['quota_errors']:>5}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not within_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""
+In-memory stand-in for the gspread client, spreadsheets and worksheets.
+
+Covers the calls the app makes, with optional per-call latency and a
+per-minute request quota that fails like the real API (HTTP 429). Used by
+benchmark.py, and by the app itself when SHEETS_BACKEND is "fake".
+"""
+
+from collections import Counter, deque
+from datetime import datetime, timezone
+import os
+import re
+import threading
+import time
+
+from gspread.exceptions import APIError, WorksheetNotFound
+
+# ============================
+# HELPERS
+# ============================
+class FakeResponse:
+    """Just enough of a requests.Response for gspread's APIError"""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+class FakeCell:
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+def _parse_range(a1):
+    """(first row, first col, last row, last col) of an A1 range; None means unbounded"""
+    first, _, last = a1.partition(":")
+    last = last or first
+    bounds = []
+    for part in (first, last):
+        match = re.fullmatch(r"([A-Z]*)(\d*)", part)
+        bounds.append((int(match.group(2)) if match.group(2) else None,
+                       _column_number(match.group(1)) if match.group(1) else None))
+    return bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1]
+
+def _split_range(name):
+    """Worksheet title and A1 part of a range such as 'Batch 1'!A2:J9"""
+    match = re.fullmatch(r"'((?:[^']|'')*)'(?:!(.+))?|([^!]+)(?:!(.+))?", name)
+    if match.group(1) is not None:
+        return match.group(1).replace("''", "'"), match.group(2)
+    return match.group(3), match.group(4)
+
+def _trim(rows):
+    """Drop trailing empty cells and rows, as the Sheets API does"""
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and row[-1] in ("", None):
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+def _cell_value(value):
+    return "" if value is None else str(value)
+
+# ============================
+# FAKE GSPREAD OBJECTS
+# ============================
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        # The grid size as the API knows it, and as this handle last saw it:
+        # like gspread, row_count is only refreshed by worksheets() and resizes
+        self.grid_rows = rows
+        self.row_count = rows
+        self.col_count = cols
+        self.rows = []
+
+    def _call(self, name):
+        self.spreadsheet.client.call(name)
+
+    def _touch(self):
+        self.spreadsheet.touch()
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = _cell_value(value)
+
+    def _values(self, a1=None):
+        if not a1:
+            return _trim(self.rows)
+        first_row, first_col, last_row, last_col = _parse_range(a1)
+        first_row = first_row or 1
+        first_col = first_col or 1
+        last_row = last_row or len(self.rows)
+        values = [row[first_col - 1:last_col] for row in self.rows[first_row - 1:last_row]]
+        return _trim(values)
+
+    def _append(self, rows):
+        self._touch()
+        first = len(_trim(self.rows)) + 1
+        del self.rows[first - 1:]
+        self.rows.extend([_cell_value(value) for value in row] for row in rows)
+        self.grid_rows = max(self.grid_rows, len(self.rows))
+        last = len(self.rows)
+        width = max((len(row) for row in rows), default=1)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:{chr(64 + min(width, 26))}{last}",
+                            "updatedRows": len(rows)}}
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        return self._append([values])
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        return self._append(values)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        self._touch()
+        for item in data:
+            first_row, first_col, _, _ = _parse_range(item["range"])
+            for row_offset, values in enumerate(item["values"]):
+                for col_offset, value in enumerate(values):
+                    self._set(first_row + row_offset, first_col + col_offset, value)
+        return {"totalUpdatedCells": sum(len(values) for item in data for values in item["values"])}
+
+    def update(self, values, range_name="A1", **kwargs):
+        self._call("update")
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self._touch()
+        first_row, first_col, _, _ = _parse_range(range_name)
+        for row_offset, row in enumerate(values):
+            for col_offset, value in enumerate(row):
+                self._set(first_row + row_offset, first_col + col_offset, value)
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call("delete_rows")
+        self._touch()
+        del self.rows[start_index - 1:end_index or start_index]
+        self.grid_rows -= (end_index or start_index) - start_index + 1
+        self.row_count = self.grid_rows
+
+    def resize(self, rows=None, cols=None):
+        self._call("resize")
+        self._touch()
+        if rows is not None:
+            # Shrinking drops the rows past the new end, as Sheets does
+            del self.rows[rows:]
+            self.grid_rows = self.row_count = rows
+        if cols is not None:
+            self.col_count = cols
+
+    def add_rows(self, rows):
+        # gspread resizes relative to the cached size, not the live grid
+        self.resize(rows=self.row_count + rows)
+
+    def acell(self, label, **kwargs):
+        self._call("acell")
+        row, col, _, _ = _parse_range(label)
+        try:
+            value = self.rows[row - 1][col - 1]
+        except IndexError:
+            value = None
+        return FakeCell(row, col, value or None)
+
+    def col_values(self, col, **kwargs):
+        self._call("col_values")
+        return [row[col - 1] if len(row) >= col else "" for row in _trim(self.rows)]
+
+    def get_all_values(self, **kwargs):
+        self._call("get_all_values")
+        return self._values()
+
+    def get_all_records(self, **kwargs):
+        self._call("get_all_records")
+        values = self._values()
+        if not values:
+            return []
+        headers = values[0]
+        return [dict(zip(headers, row + [""] * (len(headers) - len(row)))) for row in values[1:]]
+
+    def format(self, *args, **kwargs):
+        self._call("format")
+
+class FakeSpreadsheet:
+    def __init__(self, client, url):
+        self.client = client
+        self.url = url
+        self.id = url
+        self.title = url
+        self._worksheets = []
+        self._next_id = 1
+        self.updated_at = datetime.now(timezone.utc)
+
+    def touch(self):
+        self.updated_at = datetime.now(timezone.utc)
+
+    def _new_worksheet(self, title, rows=1000, cols=26, sheet_id=None):
+        if any(worksheet.title == title for worksheet in self._worksheets):
+            raise APIError(FakeResponse(400, f"A sheet with the name \"{title}\" already exists."))
+        if sheet_id is None:
+            sheet_id = self._next_id
+        self._next_id = max(self._next_id, sheet_id) + 1
+        worksheet = FakeWorksheet(self, title, sheet_id, rows, cols)
+        self._worksheets.append(worksheet)
+        self.touch()
+        return worksheet
+
+    def worksheets(self, **kwargs):
+        self.client.call("worksheets")
+        for worksheet in self._worksheets:
+            worksheet.row_count = worksheet.grid_rows
+        return list(self._worksheets)
+
+    def worksheet(self, title):
+        self.client.call("worksheet")
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.client.call("add_worksheet")
+        return self._new_worksheet(title, int(rows), int(cols))
+
+    def del_worksheet(self, worksheet):
+        self.client.call("del_worksheet")
+        self._worksheets.remove(worksheet)
+        self.touch()
+
+    def values_batch_get(self, ranges, params=None):
+        self.client.call("values_batch_get")
+        by_title = {worksheet.title: worksheet for worksheet in self._worksheets}
+        value_ranges = []
+        for name in ranges:
+            title, a1 = _split_range(name)
+            if title not in by_title:
+                raise APIError(FakeResponse(400, f"Unable to parse range: {name}"))
+            value_ranges.append({"range": name, "majorDimension": "ROWS", "values": by_title[title]._values(a1)})
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+    def batch_update(self, body):
+        self.client.call("spreadsheet_batch_update")
+        replies = []
+        for request in body.get("requests", []):
+            if "addSheet" in request:
+                properties = request["addSheet"]["properties"]
+                grid = properties.get("gridProperties", {})
+                worksheet = self._new_worksheet(properties["title"], grid.get("rowCount", 1000),
+                                                grid.get("columnCount", 26), properties.get("sheetId"))
+                replies.append({"addSheet": {"properties": {"sheetId": worksheet.id, "title": worksheet.title}}})
+            elif "updateCells" in request:
+                update = request["updateCells"]
+                worksheet = next(w for w in self._worksheets if w.id == update["start"]["sheetId"])
+                first_row = update["start"].get("rowIndex", 0) + 1
+                first_col = update["start"].get("columnIndex", 0) + 1
+                for row_offset, row in enumerate(update["rows"]):
+                    for col_offset, cell in enumerate(row.get("values", [])):
+                        value = next(iter(cell.get("userEnteredValue", {"stringValue": ""}).values()))
+                        worksheet._set(first_row + row_offset, first_col + col_offset, value)
+                replies.append({})
+            elif "deleteSheet" in request:
+                sheet_id = request["deleteSheet"]["sheetId"]
+                if len(self._worksheets) == 1:
+                    raise APIError(FakeResponse(400, "You can't remove all the sheets in a document."))
+                self._worksheets = [worksheet for worksheet in self._worksheets if worksheet.id != sheet_id]
+                replies.append({})
+            else:
+                # Formatting and other requests have no effect on values
+                replies.append({})
+        self.touch()
+        return {"spreadsheetId": self.id, "replies": replies}
+
+    def get_lastUpdateTime(self):
+        self.client.call("get_lastUpdateTime")
+        return self.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+class FakeClient:
+    """gspread client whose spreadsheets live in memory
+
+    latency is slept on every call; quota_per_minute, when set, makes calls
+    beyond that many in any 60 second window fail with a 429 APIError.
+    """
+
+    def __init__(self, latency=0.0, quota_per_minute=None):
+        self.latency = latency
+        self.quota_per_minute = quota_per_minute
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self._recent = deque()
+        self._spreadsheets = {}
+
+    def call(self, name):
+        """Count a call against the quota, then simulate its latency"""
+        with self.lock:
+            self.calls[name] += 1
+            if self.quota_per_minute:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] >= 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.quota_per_minute:
+                    self.calls["quota_errors"] += 1
+                    raise APIError(FakeResponse(429, "Quota exceeded for quota metric 'Read requests'"))
+                self._recent.append(now)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_by_url(self, url):
+        self.call("open_by_url")
+        with self.lock:
+            if url not in self._spreadsheets:
+                self._spreadsheets[url] = FakeSpreadsheet(self, url)
+            return self._spreadsheets[url]
+
+    def create(self, title, folder_id=None):
+        """New spreadsheet with one empty "Sheet1", like the Drive API makes"""
+        self.call("create")
+        with self.lock:
+            url = f"https://docs.google.com/spreadsheets/d/fake{len(self._spreadsheets) + 1}"
+            spreadsheet = self._spreadsheets[url] = FakeSpreadsheet(self, url)
+        spreadsheet.title = title
+        spreadsheet._new_worksheet("Sheet1")
+        return spreadsheet
+
+    def seed(self, links, headers, batches=4, students=100):
+        """Fill the spreadsheets with batches holding `students` students in total
+
+        links maps batch type to spreadsheet URL; batches alternate between
+        the types. Seeding is not counted as API calls.
+        """
+        types = list(links)
+        per_batch, extra = divmod(students, batches)
+        timestamp = "2025-01-01 00:00:00"
+        number = 0
+        for batch_number in range(batches):
+            batch_type = types[batch_number % len(types)]
+            with self.lock:
+                spreadsheet = self._spreadsheets.setdefault(links[batch_type], FakeSpreadsheet(self, links[batch_type]))
+            worksheet = spreadsheet._new_worksheet(f"{batch_type}_2025_Batch{batch_number + 1}", 1000, len(headers))
+            worksheet.rows.append(list(headers))
+            for _ in range(per_batch + (batch_number < extra)):
+                number += 1
+                worksheet.rows.append([f"Student {number}", f"STU{number:06d}", f"017{number:08d}",
+                                       f"student{number}@example.com", worksheet.title, batch_type,
+                                       ["4pm", "6pm"][batch_number % 2], "2025", timestamp, timestamp])
+            worksheet.grid_rows = worksheet.row_count = max(worksheet.row_count, len(worksheet.rows))
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+            self._recent.clear()
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def shared_client(links, headers):
+    """Process-wide fake client, configured and seeded from FAKE_SHEETS_* variables"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            quota = int(os.environ.get("FAKE_SHEETS_QUOTA", "0"))
+            _shared_client = FakeClient(float(os.environ.get("FAKE_SHEETS_LATENCY", "0")), quota or None)
+            _shared_client.seed(links, headers,
+                                int(os.environ.get("FAKE_SHEETS_BATCHES", "4")),
+                                int(os.environ.get("FAKE_SHEETS_STUDENTS", "100")))
+        return _shared_client
+
+def use_client(client):
+    """Make client the one shared_client() returns"""
+    global _shared_client
+    with _shared_lock:
+        _shared_client = client
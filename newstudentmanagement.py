@@ -1,9 +1,33 @@
+import time
+
+# Script start, for the startup time shown with the Sheets metrics
+_script_started = time.perf_counter()
+
 import streamlit as st
-import gspread
-import pandas as pd
-from google.oauth2.service_account import Credentials
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from bisect import bisect_left, insort
 from datetime import datetime
-import time
+import csv
+import gzip
+import hashlib
+import heapq
+import itertools
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import threading
+import uuid
+
+# pandas, gspread, google-auth and the PDF libraries take most of a cold
+# start to import, so they are imported inside the functions that use them
 
 # ============================
 # PAGE CONFIGURATION
@@ -21,6 +45,133 @@ st.set_page_config(
 IELTS_SHEET_LINK = "https://docs.google.com/spreadsheets/d/1rxO0DSqjaevC5rvuCpwU0Z94jTZZ_PVt72Vnu44H5js/edit?usp=sharing"
 APTIS_SHEET_LINK = "https://docs.google.com/spreadsheets/d/1aNcZnUa5JhKE-IQ_xyJRzx7F9P5C2WbnDwO0lVQPWPU/edit?usp=sharing"
 
+# Where batches and students are stored: "sheets" (Google Sheets),
+# "sqlite" (a local database at STORAGE_PATH) or "memory" (this process only)
+STORAGE_BACKEND = "sheets"
+STORAGE_PATH = "students.db"
+
+# "google", or "fake" to run against in-memory sheets from fake_sheets.py
+# (configured with the FAKE_SHEETS_* environment variables)
+SHEETS_BACKEND = os.environ.get("SHEETS_BACKEND", "google")
+
+# How long (seconds) spreadsheet handles and worksheet lists are reused
+# across all sessions before being fetched again from Google Sheets
+SHEETS_CACHE_TTL = 300
+
+# When the shared snapshot expires, only worksheets whose key columns
+# changed are reloaded, and only in spreadsheets Drive reports as modified.
+# Everything is reloaded at least this often (seconds) regardless
+SNAPSHOT_FULL_RELOAD = 3600
+
+# New batch worksheets start with WORKSHEET_INITIAL_ROWS rows and grow by
+# WORKSHEET_GROWTH_BLOCK rows whenever an append leaves fewer than
+# WORKSHEET_GROWTH_MARGIN empty rows
+WORKSHEET_INITIAL_ROWS = 200
+WORKSHEET_GROWTH_BLOCK = 1000
+WORKSHEET_GROWTH_MARGIN = 100
+
+# The spreadsheet at each type's link lists further spreadsheets (shards) of
+# that type in its SHARD_MANIFEST_SHEET worksheet. New batches go into the
+# newest shard; once that would exceed SHARD_MAX_CELLS cells or
+# SHARD_MAX_WORKSHEETS worksheets, a new shard is created. Shards are owned
+# by the service account, so set SHARD_FOLDER_ID to a Drive folder shared
+# with the team to make them visible to people as well
+SHARD_MANIFEST_SHEET = "_shards"
+SHARD_MAX_CELLS = 2_000_000
+SHARD_MAX_WORKSHEETS = 60
+SHARD_FOLDER_ID = None
+
+# Maximum number of worksheet ranges fetched in one batched values request
+BULK_READ_CHUNK = 100
+
+# Fetch spreadsheets and worksheet ranges concurrently on a bounded thread pool
+PARALLEL_LOADING = True
+LOADER_MAX_WORKERS = 4
+
+BATCH_TYPES = ["IELTS", "Aptis"]
+
+# Column headers of every batch worksheet (A to J)
+STUDENT_HEADERS = [
+    "Student Name", 
+    "Student ID", 
+    "Contact", 
+    "Email", 
+    "Batch", 
+    "Type", 
+    "Time",
+    "Year",
+    "Created Date",
+    "Last Updated"
+]
+
+# Column letter of every header, for single-cell updates
+COLUMN_LETTERS = {header: chr(ord("A") + i) for i, header in enumerate(STUDENT_HEADERS)}
+
+# Fields update_student() may change; the rest are fixed when a student is added
+EDITABLE_FIELDS = ["Student Name", "Student ID", "Contact", "Email", "Time", "Year"]
+
+# Values that must be unique across every batch: "reject" refuses an add,
+# edit or import row that reuses one, "warn" lets it through with a warning
+UNIQUE_FIELDS = {"Student ID": "reject", "Email": "warn", "Contact": "warn"}
+
+# Optional local SQLite read replica, refreshed from the sheets by a
+# background thread every REPLICA_SYNC_INTERVAL seconds
+USE_LOCAL_REPLICA = False
+REPLICA_PATH = "student_replica.db"
+REPLICA_SYNC_INTERVAL = 60
+
+# Bulk import writes this many rows per append request
+IMPORT_CHUNK_SIZE = 200
+
+# Quota (429) and server errors are retried with exponential backoff
+RETRY_STATUS_CODES = {429, 500, 502, 503}
+# Appends are not idempotent: a server error can come after the rows were
+# written, so only quota errors, which reject the request, are retried
+APPEND_RETRY_STATUS_CODES = {429}
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+
+# Optional write-behind queue: add/update/delete are stored locally and
+# committed to the sheets by a background worker
+USE_WRITE_QUEUE = False
+WRITE_QUEUE_PATH = "write_queue.db"
+WRITE_QUEUE_INTERVAL = 2
+
+# Exports are written EXPORT_CHUNK_SIZE rows at a time into EXPORT_DIR,
+# which keeps the EXPORT_CACHE_FILES most recent files for reuse
+EXPORT_DIR = "exports"
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_CACHE_FILES = 20
+
+# Rendered roster/attendance PDFs are cached per batch in PDF_DIR; printing
+# every batch renders the outdated ones on a pool of worker processes
+PDF_DIR = "rosters"
+PARALLEL_PDF = True
+PDF_MAX_WORKERS = 4
+
+# Archived batches are moved out of live storage into one compressed file
+# each in ARCHIVE_DIR (zstd Parquet, or gzip CSV without pyarrow), with a
+# SQLite index of names, IDs, contacts and emails for searching them
+ARCHIVE_DIR = "archive"
+
+# Every Sheets API call is counted and timed per page and function; the
+# admin panel showing the numbers is only drawn when SHOW_SHEETS_METRICS is on
+SHOW_SHEETS_METRICS = False
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# All Sheets calls in this process share one token bucket refilled at
+# SHEETS_RATE_LIMIT calls per minute (0 turns it off), allowing bursts of
+# SHEETS_BURST. Sessions' writes go first, then their reads, then
+# background threads (replica sync, write queue)
+SHEETS_RATE_LIMIT = 60
+SHEETS_BURST = 15
+SHEETS_WRITE_CALLS = {"append_row", "append_rows", "batch_update", "delete_rows", "update", "add_rows",
+                      "resize", "add_worksheet", "create"}
+
+# Seconds the script may spend on imports and setup before drawing a page;
+# checked by benchmark.py and shown in the metrics panel
+STARTUP_TIME_BUDGET = 0.3
+
 # ============================
 # SESSION STATE INITIALIZATION
 # ============================
@@ -34,10 +185,17 @@ if 'edit_mode' not in st.session_state:
 # ============================
 # AUTHENTICATION
 # ============================
-@st.cache_resource
+@st.cache_resource(show_spinner="Connecting to Google Sheets...")
 def get_gspread_client():
-    """Initialize Google Sheets client"""
+    """Initialize Google Sheets client on first use"""
+    if SHEETS_BACKEND == "fake":
+        import fake_sheets
+        return fake_sheets.shared_client({"IELTS": IELTS_SHEET_LINK, "Aptis": APTIS_SHEET_LINK}, STUDENT_HEADERS)
+    
     try:
+        import gspread
+        from google.oauth2.service_account import Credentials
+        
         # Check for credentials
         if 'gcp_service_account' not in st.secrets:
             st.error("❌ Missing Google Service Account credentials in secrets.toml")
@@ -70,49 +228,471 @@ def get_gspread_client():
         st.error(f"❌ Authentication failed: {str(e)}")
         return None
 
-# Initialize client
-gc = get_gspread_client()
-
 # ============================
-# GOOGLE SHEETS FUNCTIONS
+# SHEETS API METRICS
 # ============================
-def get_spreadsheet(batch_type):
-    """Get spreadsheet by type"""
-    if not gc:
+def _api_status(error):
+    """HTTP status of a gspread APIError, if there is one"""
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+class SheetsMetrics:
+    """Call counts, latency histograms and errors of Sheets API calls
+    
+    Series are keyed by (page, function); calls made outside a session,
+    by the replica sync or write queue threads, count under "background".
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.started_at = datetime.now()
+    
+    def record(self, page, function, seconds, status=None, failed=False):
+        with self.lock:
+            series = self.series.get((page, function))
+            if series is None:
+                series = self.series[(page, function)] = {
+                    "calls": 0, "errors": 0, "quota_errors": 0, "seconds": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1)
+                }
+            series["calls"] += 1
+            series["seconds"] += seconds
+            series["buckets"][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if failed:
+                series["errors"] += 1
+            if status == 429:
+                series["quota_errors"] += 1
+    
+    def rows(self):
+        """One summary dict per (page, function), busiest first"""
+        with self.lock:
+            items = [(key, dict(series)) for key, series in self.series.items()]
+        return [
+            {
+                "Page": page, "Function": function, "Calls": series["calls"],
+                "Errors": series["errors"], "Quota Errors": series["quota_errors"],
+                "Total (s)": round(series["seconds"], 3),
+                "Avg (ms)": round(series["seconds"] / series["calls"] * 1000, 1)
+            }
+            for (page, function), series in sorted(items, key=lambda item: -item[1]["calls"])
+        ]
+    
+    def to_json(self, scheduler=None):
+        with self.lock:
+            series = [{"page": page, "function": function, **values, "buckets": list(values["buckets"])}
+                      for (page, function), values in self.series.items()]
+        dump = {"since": self.started_at.isoformat(timespec="seconds"),
+                "bucket_bounds": list(LATENCY_BUCKETS), "series": series}
+        if scheduler:
+            dump["scheduler"] = scheduler.stats()
+        return json.dumps(dump, indent=2)
+    
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        with self.lock:
+            items = sorted((key, dict(series, buckets=list(series["buckets"]))) for key, series in self.series.items())
+        
+        def labels(page, function, **extra):
+            pairs = {"page": page, "function": function, **extra}
+            return ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in pairs.items())
+        
+        # Samples of a metric family must be grouped under its TYPE line
+        lines = []
+        for name, field in [("sheets_api_calls_total", "calls"), ("sheets_api_errors_total", "errors"),
+                            ("sheets_api_quota_errors_total", "quota_errors")]:
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{name}{{{labels(page, function)}}} {series[field]}" for (page, function), series in items]
+        
+        lines.append("# TYPE sheets_api_latency_seconds histogram")
+        for (page, function), series in items:
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], series["buckets"]):
+                cumulative += count
+                lines.append(f"sheets_api_latency_seconds_bucket{{{labels(page, function, le=bound)}}} {cumulative}")
+            lines.append(f"sheets_api_latency_seconds_sum{{{labels(page, function)}}} {series['seconds']:.6f}")
+            lines.append(f"sheets_api_latency_seconds_count{{{labels(page, function)}}} {series['calls']}")
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.started_at = datetime.now()
+
+@st.cache_resource
+def get_sheets_metrics():
+    """Process-wide Sheets API metrics, shared by all sessions"""
+    return SheetsMetrics()
+
+PRIORITY_NAMES = ["write", "read", "background"]
+
+class SheetsRateLimiter:
+    """Token bucket shared by every Sheets call in the process
+    
+    Callers wait for a token instead of failing. Waiters are served by
+    priority (0 = interactive write, 1 = read, 2 = background), first come
+    first served within a priority.
+    """
+    
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.granted = [0] * len(PRIORITY_NAMES)
+        self.waited = [0.0] * len(PRIORITY_NAMES)
+        self.max_wait = 0.0
+        self.quota_pauses = 0
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, priority):
+        """Block until this caller may make one Sheets call"""
+        started = time.monotonic()
+        with self.condition:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.waiting[0] == ticket and now >= self.paused_until and self.tokens >= 1:
+                        break
+                    if self.waiting[0] == ticket:
+                        # First in line: sleep until the next token or the pause ends
+                        self.condition.wait(max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.01))
+                    else:
+                        self.condition.wait()
+                self.tokens -= 1
+                heapq.heappop(self.waiting)
+            except BaseException:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                raise
+            finally:
+                # Let the next caller in line check its turn
+                self.condition.notify_all()
+            
+            waited = time.monotonic() - started
+            self.granted[priority] += 1
+            self.waited[priority] += waited
+            self.max_wait = max(self.max_wait, waited)
+    
+    def penalize(self, seconds):
+        """Hold every caller back after the API reported a quota error"""
+        with self.condition:
+            self.tokens = min(self.tokens, 0)
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.quota_pauses += 1
+    
+    def stats(self):
+        """Queue depth and wait times by priority"""
+        with self.condition:
+            self._refill(time.monotonic())
+            depth = Counter(priority for priority, _ in self.waiting)
+            return {
+                "tokens": round(self.tokens, 2),
+                "rate_per_minute": self.rate * 60,
+                "quota_pauses": self.quota_pauses,
+                "max_wait_seconds": round(self.max_wait, 3),
+                "priorities": {
+                    name: {"waiting": depth.get(priority, 0), "granted": self.granted[priority],
+                           "wait_seconds": round(self.waited[priority], 3)}
+                    for priority, name in enumerate(PRIORITY_NAMES)
+                }
+            }
+    
+    def to_prometheus(self):
+        stats = self.stats()
+        lines = ["# TYPE sheets_scheduler_queue_depth gauge"]
+        lines += [f'sheets_scheduler_queue_depth{{priority="{name}"}} {values["waiting"]}'
+                  for name, values in stats["priorities"].items()]
+        lines.append("# TYPE sheets_scheduler_wait_seconds_total counter")
+        lines += [f'sheets_scheduler_wait_seconds_total{{priority="{name}"}} {values["wait_seconds"]}'
+                  for name, values in stats["priorities"].items()]
+        lines.append("# TYPE sheets_scheduler_tokens gauge")
+        lines.append(f"sheets_scheduler_tokens {stats['tokens']}")
+        return "\n".join(lines) + "\n"
+
+@st.cache_resource
+def get_sheets_limiter():
+    """Process-wide Sheets rate limiter, or None when SHEETS_RATE_LIMIT is 0"""
+    if not SHEETS_RATE_LIMIT:
         return None
+    return SheetsRateLimiter(SHEETS_RATE_LIMIT, SHEETS_BURST)
+
+# Page set by sheets_caller() for the current thread
+_sheets_caller = threading.local()
+
+@contextmanager
+def sheets_caller(page):
+    """Make Sheets calls in this thread count as a session's, under page
     
+    For callers without a Streamlit session, such as student_api.py, whose
+    requests should not wait behind background syncs.
+    """
+    previous = getattr(_sheets_caller, "page", None)
+    _sheets_caller.page = page
     try:
-        if batch_type == "IELTS":
-            # TODO: Replace with your actual IELTS sheet link
-            spreadsheet = gc.open_by_url(IELTS_SHEET_LINK)
-        else:  # Aptis
-            # TODO: Replace with your actual Aptis sheet link
-            spreadsheet = gc.open_by_url(APTIS_SHEET_LINK)
-        return spreadsheet
-    except Exception as e:
-        st.error(f"❌ Error accessing {batch_type} sheet: {str(e)}")
-        return None
+        yield
+    finally:
+        _sheets_caller.page = previous
+
+def _current_page():
+    """Page of the session making a call, or "background" outside sessions"""
+    page = getattr(_sheets_caller, "page", None)
+    if page:
+        return page
+    if get_script_run_ctx() is None:
+        return "background"
+    try:
+        return st.session_state.get("page", "Home")
+    except Exception:
+        return "background"
+
+def sheets_call(func, *args, **kwargs):
+    """Call a gspread function once the rate limiter allows it
+    
+    Every Sheets API request made by the app goes through here. Quota
+    errors are waited out and retried; latency and outcome are recorded.
+    """
+    page = _current_page()
+    name = func.__name__
+    if page == "background":
+        priority = 2
+    else:
+        priority = 0 if name in SHEETS_WRITE_CALLS else 1
+    limiter = get_sheets_limiter()
+    
+    for attempt in range(MAX_RETRIES):
+        if limiter:
+            limiter.acquire(priority)
+        status = None
+        failed = False
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            failed = True
+            status = _api_status(e)
+            if status != 429 or attempt == MAX_RETRIES - 1:
+                raise
+        finally:
+            seconds = time.perf_counter() - started
+            get_sheets_metrics().record(page, name, seconds, status, failed)
+            if page != "background":
+                # Per-rerun tally for the metrics panel
+                try:
+                    st.session_state.setdefault("rerun_sheets_calls", []).append((name, seconds))
+                except Exception:
+                    pass
+        
+        # Over quota anyway (other processes share it): slow everyone down
+        delay = RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+        if limiter:
+            limiter.penalize(delay)
+        else:
+            time.sleep(delay)
+
+# ============================
+# STUDENT RECORDS
+# ============================
+# Record attribute for every worksheet column
+HEADER_FIELDS = {
+    "Student Name": "name",
+    "Student ID": "student_id",
+    "Contact": "contact",
+    "Email": "email",
+    "Batch": "batch",
+    "Type": "type",
+    "Time": "time",
+    "Year": "year",
+    "Created Date": "created_date",
+    "Last Updated": "last_updated"
+}
+
+@dataclass
+class StudentRecord:
+    """One student row, compact and picklable
+    
+    The record points at its batch by name; writes go through the
+    storage backend, which looks the batch up again.
+    """
+    __slots__ = ("name", "student_id", "contact", "email", "batch", "type", "time", "year",
+                 "created_date", "last_updated", "row", "batch_name", "batch_type", "key")
+    name: object
+    student_id: object
+    contact: object
+    email: object
+    batch: object
+    type: object
+    time: object
+    year: object
+    created_date: object
+    last_updated: object
+    row: int
+    batch_name: str
+    batch_type: str
+    key: object
+    
+    @classmethod
+    def from_mapping(cls, values, row_index, batch_name, batch_type):
+        """Build a record from a {header: value} mapping"""
+        return cls(*(values.get(header, "") for header in STUDENT_HEADERS),
+                   row_index, batch_name, batch_type, None)
+    
+    def get(self, header, default=None):
+        """Value of a worksheet column by its header"""
+        field = HEADER_FIELDS.get(header)
+        return getattr(self, field) if field else default
+    
+    def update(self, values):
+        """Set worksheet columns from a {header: value} mapping"""
+        for header, value in values.items():
+            setattr(self, HEADER_FIELDS[header], value)
+    
+    def to_dict(self):
+        """Worksheet columns as a {header: value} dict, e.g. for DataFrames"""
+        return {header: getattr(self, field) for header, field in HEADER_FIELDS.items()}
+
+# ============================
+# GOOGLE SHEETS FUNCTIONS
+# ============================
+def _sheet_link(batch_type):
+    """Link of the first spreadsheet of a batch type, which holds its shard manifest"""
+    if batch_type == "IELTS":
+        # TODO: Replace with your actual IELTS sheet link
+        return IELTS_SHEET_LINK
+    # TODO: Replace with your actual Aptis sheet link
+    return APTIS_SHEET_LINK
+
+@st.cache_resource(ttl=SHEETS_CACHE_TTL, show_spinner=False)
+def _open_spreadsheet(link):
+    """Open a spreadsheet once per TTL window, shared by all sessions"""
+    return sheets_call(get_gspread_client().open_by_url, link)
+
+@st.cache_resource(ttl=SHEETS_CACHE_TTL, show_spinner=False)
+def _spreadsheet_worksheets(link):
+    """List every worksheet of one spreadsheet once per TTL window"""
+    return sheets_call(_open_spreadsheet(link).worksheets)
+
+@st.cache_resource(ttl=SHEETS_CACHE_TTL, show_spinner=False)
+def _shard_links(batch_type):
+    """Links of the spreadsheets holding batches of a type, oldest first"""
+    link = _sheet_link(batch_type)
+    manifest = next((ws for ws in _spreadsheet_worksheets(link) if ws.title == SHARD_MANIFEST_SHEET), None)
+    if manifest is None:
+        return [link]
+    shards = sheets_call(manifest.col_values, 1)[1:]  # Row 1 is the header
+    return [link] + [shard for shard in shards if shard]
+
+def _list_worksheets(batch_type):
+    """Batch worksheets of a type across all its shards, from the cached lists"""
+    return [ws for link in _shard_links(batch_type) for ws in _spreadsheet_worksheets(link)
+            if ws.title != SHARD_MANIFEST_SHEET]
+
+@st.cache_resource(ttl=SHEETS_CACHE_TTL, show_spinner=False)
+def _worksheets_by_title():
+    """Registry of batch name -> (shard link, worksheet handle) from the cached worksheet lists"""
+    worksheets = {}
+    for batch_type in BATCH_TYPES:
+        try:
+            for link in _shard_links(batch_type):
+                for ws in _spreadsheet_worksheets(link):
+                    if ws.title != SHARD_MANIFEST_SHEET:
+                        worksheets[ws.title] = (link, ws)
+        except Exception:
+            continue
+    return worksheets
+
+def _batch_shard(batch):
+    """Link of the spreadsheet holding a batch"""
+    if batch.get("shard"):
+        return batch["shard"]
+    link, _ = _worksheets_by_title().get(batch["name"], (_sheet_link(batch["type"]), None))
+    return link
+
+def get_worksheet(batch_name):
+    """Live worksheet handle of a batch, or None if it does not exist"""
+    _, worksheet = _worksheets_by_title().get(batch_name, (None, None))
+    if worksheet is None:
+        # The registry may predate the batch; look once more
+        invalidate_worksheet_lists()
+        _, worksheet = _worksheets_by_title().get(batch_name, (None, None))
+    return worksheet
+
+def invalidate_worksheet_lists():
+    """Drop cached worksheet lists and shard manifests, keeping the spreadsheet handles"""
+    _spreadsheet_worksheets.clear()
+    _shard_links.clear()
+    _worksheets_by_title.clear()
+
+def invalidate_sheet_cache():
+    """Drop cached spreadsheet handles and worksheet lists"""
+    _open_spreadsheet.clear()
+    invalidate_worksheet_lists()
+
+def run_parallel(tasks):
+    """Run {label: (func, *args)} tasks, concurrently if PARALLEL_LOADING is on
+    
+    Returns (results, failures): both dicts keyed by task label, holding the
+    return value or the exception raised by each task.
+    """
+    results, failures = {}, {}
+    if not tasks:
+        return results, failures
+    
+    if not PARALLEL_LOADING or len(tasks) == 1:
+        for label, (func, *args) in tasks.items():
+            try:
+                results[label] = func(*args)
+            except Exception as e:
+                failures[label] = e
+        return results, failures
+    
+    ctx = get_script_run_ctx()
+    caller = getattr(_sheets_caller, "page", None)
+    
+    def run_task(func, *args):
+        # Let cached functions see the session that started the load
+        add_script_run_ctx(threading.current_thread(), ctx)
+        with sheets_caller(caller):
+            return func(*args)
+    
+    with ThreadPoolExecutor(max_workers=min(LOADER_MAX_WORKERS, len(tasks))) as pool:
+        futures = {label: pool.submit(run_task, *task) for label, task in tasks.items()}
+        for label, future in futures.items():
+            try:
+                results[label] = future.result()
+            except Exception as e:
+                failures[label] = e
+    
+    return results, failures
 
 def get_all_batches():
     """Get all batches from both sheets"""
     all_batches = []
     
-    if not gc:
+    if not get_repository():
         return all_batches
     
-    for batch_type in ["IELTS", "Aptis"]:
-        spreadsheet = get_spreadsheet(batch_type)
-        if spreadsheet:
-            try:
-                worksheets = spreadsheet.worksheets()
-                for ws in worksheets:
-                    all_batches.append({
-                        "name": ws.title,
-                        "type": batch_type,
-                        "worksheet": ws
-                    })
-            except:
-                continue
+    replica = get_replica()
+    if replica and replica.is_ready():
+        return replica.read_batches()
+    
+    results, failures = run_parallel(
+        {batch_type: (get_repository().list_batches, batch_type) for batch_type in BATCH_TYPES}
+    )
+    for batch_type, error in failures.items():
+        st.error(f"❌ Error accessing {batch_type} batches: {str(error)}")
+    
+    for batch_type in BATCH_TYPES:
+        all_batches.extend(results.get(batch_type, []))
     
     return all_batches
 
@@ -121,147 +701,2529 @@ def get_batch_names():
     batches = get_all_batches()
     return [batch["name"] for batch in batches]
 
+def _new_batch_requests(batch_name, sheet_id):
+    """batch_update requests that add a batch worksheet with its formatted header row"""
+    header_format = {
+        'textFormat': {'bold': True},
+        'backgroundColor': {'red': 0.2, 'green': 0.6, 'blue': 0.8, 'alpha': 0.3}
+    }
+    return [
+        {"addSheet": {"properties": {
+            "sheetId": sheet_id,
+            "title": batch_name,
+            "gridProperties": {"rowCount": WORKSHEET_INITIAL_ROWS, "columnCount": len(STUDENT_HEADERS)}
+        }}},
+        {"updateCells": {
+            "start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": 0},
+            "rows": [{"values": [
+                {"userEnteredValue": {"stringValue": header}, "userEnteredFormat": header_format}
+                for header in STUDENT_HEADERS
+            ]}],
+            "fields": "userEnteredValue,userEnteredFormat(textFormat,backgroundColor)"
+        }}
+    ]
+
+def create_batch_worksheets(batch_names, batch_type):
+    """Create several batch worksheets of one type with a single request"""
+    if not get_repository():
+        return False
+    
+    try:
+        get_repository().create_batches(batch_names, batch_type)
+        invalidate_roster_snapshot()
+        return True
+        
+    except Exception as e:
+        st.error(f"❌ Error creating batch: {str(e)}")
+        return False
+
 def create_batch_worksheet(batch_name, batch_type, year, time_slot):
     """Create a new batch worksheet"""
-    spreadsheet = get_spreadsheet(batch_type)
-    if not spreadsheet:
+    return create_batch_worksheets([batch_name], batch_type)
+
+def term_batch_names(year, batch_types, time_slots, label=""):
+    """Names of every Type x Time slot batch of a term, grouped by type"""
+    names = {}
+    for batch_type in batch_types:
+        for time_slot in time_slots:
+            parts = [batch_type, label, time_slot, str(year)]
+            names.setdefault(batch_type, []).append("_".join(part for part in parts if part))
+    return names
+
+def create_term_batches(names_by_type):
+    """Create a whole term of batches, one request per spreadsheet
+    
+    Returns the names of the batches that were created.
+    """
+    created = []
+    for batch_type, batch_names in names_by_type.items():
+        if batch_names and create_batch_worksheets(batch_names, batch_type):
+            created += batch_names
+    return created
+
+def _student_row(student_data, batch, timestamp=None):
+    """Build the worksheet row for a new student"""
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [
+        student_data["name"],
+        student_data["student_id"],
+        student_data["contact"],
+        student_data["email"],
+        batch["name"],
+        batch["type"],
+        student_data["time"],
+        student_data.get("year", datetime.now().year),
+        timestamp,  # Created Date
+        timestamp   # Last Updated (same as created for new)
+    ]
+
+def with_retry(func, *args, **kwargs):
+    """Call a Sheets function, retrying server errors with backoff
+    
+    Only for idempotent calls: a server error can come after the request
+    took effect. Quota errors are already waited out inside sheets_call().
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            return sheets_call(func, *args, **kwargs)
+        except Exception as e:
+            # Only gspread APIErrors carry a retryable status
+            status = _api_status(e)
+            if status not in RETRY_STATUS_CODES or status == 429 or attempt == MAX_RETRIES - 1:
+                raise
+            # Exponential backoff with jitter so sessions don't retry in lockstep
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+
+def check_unique(values, exclude=None):
+    """(errors, warnings) for values that another student already uses
+    
+    Which list a clash goes to follows UNIQUE_FIELDS.
+    """
+    errors, warnings = [], []
+    if not get_repository():
+        return errors, warnings
+    
+    holders = {header: [f"{record.name} ({record.batch_name})" for record in records]
+               for header, records in load_roster_snapshot().duplicates(values, exclude).items()}
+    # Queued writes only reach the snapshot once the worker commits them
+    write_queue = get_write_queue()
+    if write_queue:
+        for header, writes in write_queue.duplicates(values, exclude).items():
+            holders.setdefault(header, []).extend(f"{label} ({batch_name}, queued)" for label, batch_name in writes)
+    
+    for header, names in holders.items():
+        message = f"{header} '{values[header]}' is already used by {', '.join(names[:3])}"
+        (errors if UNIQUE_FIELDS[header] == "reject" else warnings).append(message)
+    return errors, warnings
+
+def add_student_to_batch(student_data, batch_name):
+    """Add student to a specific batch"""
+    batches = get_all_batches()
+    target_batch = None
+    
+    # Find the batch
+    for batch in batches:
+        if batch["name"] == batch_name:
+            target_batch = batch
+            break
+    
+    if not target_batch:
+        st.error(f"❌ Batch '{batch_name}' not found")
         return False
     
+    errors, warnings = check_unique({"Student ID": student_data["student_id"],
+                                     "Email": student_data["email"],
+                                     "Contact": student_data["contact"]})
+    for message in errors:
+        st.error(f"❌ {message}")
+    if errors:
+        return False
+    for message in warnings:
+        st.warning(f"⚠️ {message}")
+    
     try:
-        # Create new worksheet
-        worksheet = spreadsheet.add_worksheet(title=batch_name, rows="1000", cols="10")
-        
-        # Add headers
-        headers = [
-            "Student Name", 
-            "Student ID", 
-            "Contact", 
-            "Email", 
-            "Batch", 
-            "Type", 
-            "Time",
-            "Year",
-            "Created Date",
-            "Last Updated"
-        ]
-        worksheet.append_row(headers)
+        # Prepare student record
+        record = _student_row(student_data, target_batch)
         
-        # Format header
-        worksheet.format('A1:J1', {
-            'textFormat': {'bold': True},
-            'backgroundColor': {'red': 0.2, 'green': 0.6, 'blue': 0.8, 'alpha': 0.3}
-        })
+        write_queue = get_write_queue()
+        if write_queue:
+            write_queue.enqueue("add", target_batch, None, record, label=student_data["name"])
+            st.info("🕒 Queued: the student will be saved to Google Sheets shortly.")
+            return True
         
+        # Add to worksheet
+        row_index = get_repository().append_rows(target_batch, [record])
+        if row_index is None:
+            invalidate_roster_snapshot()
+        else:
+            apply_to_snapshot("add_student", _make_record(record, row_index, target_batch))
         return True
         
     except Exception as e:
-        st.error(f"❌ Error creating batch: {str(e)}")
+        st.error(f"❌ Error adding student: {str(e)}")
+        return False
+
+def _appended_row(response):
+    """Row number written by append_row, read from the API response"""
+    updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+def _grow_worksheet(worksheet, first_row, rows):
+    """Add a block of empty rows once appends come close to the end of the grid"""
+    last_row = None if first_row is None else first_row + rows - 1
+    if last_row is None or last_row + WORKSHEET_GROWTH_MARGIN <= worksheet.row_count:
+        return
+    try:
+        # Appends grow the grid without updating the handle's cached row_count,
+        # so size from the rows just written; add_rows() would resize relative
+        # to the stale count and could cut them off
+        sheets_call(worksheet.resize, rows=max(worksheet.row_count, last_row) + WORKSHEET_GROWTH_BLOCK)
+    except Exception:
+        # The rows are written; Sheets extends a full grid by itself anyway
+        pass
+
+def _numericise_all(values):
+    """Turn numeric-looking cell strings into numbers, as gspread does on read"""
+    from gspread.utils import numericise_all
+    return numericise_all(values)
+
+def _make_record(row, row_index, batch):
+    """Build a record like get_all_students() returns from a written row"""
+    values = dict(zip(STUDENT_HEADERS, _numericise_all([str(value) for value in row])))
+    return StudentRecord.from_mapping(values, row_index, batch["name"], batch["type"])
+
+def _sheet_range(title):
+    """A1 range that covers a whole worksheet"""
+    return "'" + title.replace("'", "''") + "'"
+
+def _records_from_values(values, batch):
+    """Parse raw worksheet values into records like get_all_records()"""
+    if not values:
+        return []
+    
+    headers = values[0]
+    records = []
+    for i, row in enumerate(values[1:], start=2):  # start=2 because row 1 is header
+        row = _numericise_all(row)
+        row += [""] * (len(headers) - len(row))
+        fields = dict(zip(headers, row))
+        if fields.get("Student Name"):  # Skip empty rows
+            # Store row number for editing
+            records.append(StudentRecord.from_mapping(fields, i, batch["name"], batch["type"]))
+    return records
+
+def load_batch_records(batch_type, batches):
+    """Read the given worksheets with one batched request per shard"""
+    by_shard = {}
+    for batch in batches:
+        by_shard.setdefault(_batch_shard(batch), []).append(batch)
+    
+    records = []
+    for link, shard_batches in by_shard.items():
+        response = sheets_call(_open_spreadsheet(link).values_batch_get,
+                               [_sheet_range(b["name"]) for b in shard_batches])
+        for batch, value_range in zip(shard_batches, response.get("valueRanges", [])):
+            records.extend(_records_from_values(value_range.get("values", []), batch))
+    return records
+
+def get_all_students(batch_filter=None, batches=None):
+    """Get all students from all batches, optionally filtered by batch"""
+    all_students = []
+    batches_by_type = {}
+    
+    replica = get_replica()
+    if batches is None and replica and replica.is_ready():
+        return replica.read_students(batch_filter)
+    
+    if batches is None:
+        batches = get_all_batches()
+    
+    for batch in batches:
+        if batch_filter and batch["name"] != batch_filter:
+            continue
+        batches_by_type.setdefault(batch["type"], []).append(batch)
+    
+    # One task per spreadsheet chunk of BULK_READ_CHUNK worksheets
+    tasks = {}
+    for batch_type, batches in batches_by_type.items():
+        for start in range(0, len(batches), BULK_READ_CHUNK):
+            chunk = batches[start:start + BULK_READ_CHUNK]
+            label = f"{batch_type} ({chunk[0]['name']} … {chunk[-1]['name']})"
+            tasks[label] = (get_repository().load_students, batch_type, chunk)
+    
+    results, failures = run_parallel(tasks)
+    for label, error in failures.items():
+        st.warning(f"⚠️ Could not load students from {label}: {str(error)}")
+    
+    for label in tasks:
+        all_students.extend(results.get(label, []))
+    
+    return all_students
+
+def _cell_updates(row_index, changes):
+    """batch_update data that writes each changed field into its own cell"""
+    return [{"range": f"{COLUMN_LETTERS[header]}{row_index}", "values": [[value]]}
+            for header, value in changes.items()]
+
+@st.cache_resource
+def _batch_locks():
+    """Per-batch locks shared by every session and the write queue worker"""
+    return threading.Lock(), {}
+
+def batch_lock(batch_name):
+    """Lock held from looking up a student's row until the write to it is made
+    
+    A delete shifts every row below it up, so it must not land between
+    finding a row and writing to it.
+    """
+    guard, locks = _batch_locks()
+    with guard:
+        return locks.setdefault(batch_name, threading.RLock())
+
+def resolve_row(batch_name, row_index, student_id, version):
+    """Current row of a student, checked against the row index before a write
+    
+    If the worksheet's rows have not shifted since the record was read
+    (same version), row_index is still right. Otherwise the row is looked
+    up again by Student ID. A Student ID given without a version is checked
+    against the row as it stands.
+    
+    The row index only knows this process's writes, so the row found is
+    confirmed against the sheet's Student ID cell before a direct write.
+    Queued writes are confirmed by the worker when it sends them.
+    """
+    if version is None and student_id is None:
+        return row_index
+    snapshot = load_roster_snapshot()
+    row_index = snapshot.row_index.resolve(batch_name, row_index, student_id, version)
+    
+    if not get_write_queue():
+        current_id = get_repository().student_id_at(batch_name, row_index)
+        if _normalize(_numericise_all([str(current_id or "")])[0]) != _normalize(student_id):
+            invalidate_roster_snapshot()
+            raise ValueError(f"row {row_index} no longer holds Student ID {student_id}; please search again")
+    return row_index
+
+def update_student(row_index, batch_name, updated_data, student_id=None, version=None):
+    """Update student information"""
+    try:
+        with batch_lock(batch_name):
+            row_index = resolve_row(batch_name, row_index, student_id, version)
+            
+            errors, warnings = check_unique(updated_data, exclude=(batch_name, row_index))
+            for message in errors:
+                st.error(f"❌ {message}")
+            if errors:
+                return False
+            for message in warnings:
+                st.warning(f"⚠️ {message}")
+            
+            # Only editable fields change, plus the timestamp
+            changes = {header: updated_data[header] for header in EDITABLE_FIELDS if header in updated_data}
+            changes["Last Updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            write_queue = get_write_queue()
+            if write_queue:
+                write_queue.enqueue("update", batch_name, row_index, changes,
+                                    label=updated_data.get("Student Name", ""), student_id=student_id)
+                return True
+            
+            # Update just those cells in one request
+            get_repository().update_cells(batch_name, row_index, changes)
+            
+            values = dict(zip(changes, _numericise_all([str(value) for value in changes.values()])))
+            apply_to_snapshot("update_student", batch_name, row_index, values)
+            return True
+        
+    except Exception as e:
+        st.error(f"❌ Error updating student: {str(e)}")
         return False
 
-def add_student_to_batch(student_data, batch_name):
-    """Add student to a specific batch"""
-    batches = get_all_batches()
-    target_batch = None
+def delete_student(row_index, batch_name, student_id=None, version=None):
+    """Delete a student record"""
+    try:
+        with batch_lock(batch_name):
+            row_index = resolve_row(batch_name, row_index, student_id, version)
+            
+            write_queue = get_write_queue()
+            if write_queue:
+                # The worker checks the Student ID when it sends the delete
+                write_queue.enqueue("delete", batch_name, row_index, {}, student_id=student_id)
+                return True
+            
+            # Remove the row; the rows below it move up
+            get_repository().delete_row(batch_name, row_index)
+            apply_to_snapshot("delete_student", batch_name, row_index)
+            return True
+    except Exception as e:
+        st.error(f"❌ Error deleting student: {str(e)}")
+        return False
+
+# ============================
+# STORAGE BACKENDS
+# ============================
+class StudentRepository:
+    """Where batches and students are kept
+    
+    Students are addressed like worksheet rows: row 1 holds the headers,
+    so the first student is row 2, and deleting a row moves the rows below
+    it up by one. Every backend numbers rows this way, so row indexes and
+    the roster snapshot work the same on all of them.
+    """
+    
+    name = ""
+    
+    def list_batches(self, batch_type):
+        """Batch dicts ({"name", "type", ...}) of one type, in creation order"""
+        raise NotImplementedError
+    
+    def create_batches(self, batch_names, batch_type):
+        raise NotImplementedError
+    
+    def load_students(self, batch_type, batches):
+        """StudentRecords of the given batches of one type"""
+        raise NotImplementedError
+    
+    def append_rows(self, batch, rows):
+        """Append rows to a batch; returns the first new row, or None if unknown"""
+        raise NotImplementedError
+    
+    def update_cells(self, batch_name, row_index, changes):
+        """Write {header: value} changes into one row"""
+        raise NotImplementedError
+    
+    def student_id_at(self, batch_name, row_index):
+        raise NotImplementedError
+    
+    def delete_row(self, batch_name, row_index):
+        raise NotImplementedError
+    
+    def delete_batch(self, batch_name):
+        """Remove a batch and all of its students"""
+        raise NotImplementedError
+    
+    def modified_time(self, batch_type):
+        """Opaque marker that changes whenever any batch of the type does, or None if unknown"""
+        return None
+    
+    def batch_fingerprints(self, batch_type, batches):
+        """{batch name: batch_fingerprint()} read without loading whole batches, or None"""
+        return None
+
+class SheetsRepository(StudentRepository):
+    """Each batch is a worksheet in one of the spreadsheets (shards) of its type"""
+    
+    name = "Google Sheets"
+    
+    def __init__(self):
+        # One session at a time decides whether a new shard is needed
+        self.lock = threading.Lock()
+    
+    def _worksheet(self, batch_name):
+        worksheet = get_worksheet(batch_name)
+        if worksheet is None:
+            raise ValueError(f"Batch '{batch_name}' not found")
+        return worksheet
+    
+    def list_batches(self, batch_type):
+        return [{"name": ws.title, "type": batch_type, "worksheet": ws, "shard": link}
+                for link in _shard_links(batch_type) for ws in _spreadsheet_worksheets(link)
+                if ws.title != SHARD_MANIFEST_SHEET]
+    
+    def _add_shard(self, batch_type):
+        """Create a spreadsheet for new batches of a type and list it in the manifest
+        
+        Returns its link and the ids of the placeholder worksheets it was
+        created with, to delete once it holds a batch.
+        """
+        number = len(_shard_links(batch_type)) + 1
+        spreadsheet = sheets_call(get_gspread_client().create, f"{batch_type} Students {number}",
+                                  folder_id=SHARD_FOLDER_ID)
+        placeholders = [ws.id for ws in sheets_call(spreadsheet.worksheets)]
+        
+        primary_link = _sheet_link(batch_type)
+        manifest = next((ws for ws in _spreadsheet_worksheets(primary_link) if ws.title == SHARD_MANIFEST_SHEET), None)
+        rows = [[spreadsheet.url, datetime.now().strftime("%Y-%m-%d %H:%M:%S")]]
+        if manifest is None:
+            manifest = sheets_call(_open_spreadsheet(primary_link).add_worksheet, SHARD_MANIFEST_SHEET, rows=100, cols=2)
+        # A new manifest, or the empty placeholder delete_batch() leaves
+        # behind, needs the header row that _shard_links() skips
+        if not sheets_call(manifest.col_values, 1):
+            rows.insert(0, ["Spreadsheet", "Created Date"])
+        sheets_call(manifest.append_rows, rows)
+        
+        invalidate_worksheet_lists()
+        return spreadsheet.url, placeholders
+    
+    def _hot_shard(self, batch_type, new_worksheets):
+        """Shard new batches go into, starting a new one when the newest is full"""
+        link = _shard_links(batch_type)[-1]
+        worksheets = _spreadsheet_worksheets(link)
+        cells = sum(ws.row_count * ws.col_count for ws in worksheets)
+        cells += new_worksheets * WORKSHEET_INITIAL_ROWS * len(STUDENT_HEADERS)
+        if cells <= SHARD_MAX_CELLS and len(worksheets) + new_worksheets <= SHARD_MAX_WORKSHEETS:
+            return link, []
+        return self._add_shard(batch_type)
+    
+    def create_batches(self, batch_names, batch_type):
+        with self.lock:
+            link, placeholders = self._hot_shard(batch_type, len(batch_names))
+            spreadsheet = _open_spreadsheet(link)
+            
+            # Pick sheet ids up front so the header cells can target the new sheets
+            used_ids = {ws.id for ws in _spreadsheet_worksheets(link)}
+            requests = []
+            for batch_name in batch_names:
+                sheet_id = random.randint(1, 2 ** 31 - 1)
+                while sheet_id in used_ids:
+                    sheet_id = random.randint(1, 2 ** 31 - 1)
+                used_ids.add(sheet_id)
+                requests += _new_batch_requests(batch_name, sheet_id)
+            requests += [{"deleteSheet": {"sheetId": sheet_id}} for sheet_id in placeholders]
+            
+            # Worksheets, headers and header formatting in one round-trip
+            sheets_call(spreadsheet.batch_update, {"requests": requests})
+            
+            # New worksheets must show up in dropdowns right away; the
+            # spreadsheet handle itself is still valid
+            invalidate_worksheet_lists()
+    
+    def load_students(self, batch_type, batches):
+        return load_batch_records(batch_type, batches)
+    
+    def append_rows(self, batch, rows):
+        worksheet = self._worksheet(batch["name"])
+        # Not with_retry(): resending after a server error could add the rows
+        # twice; sheets_call() still waits out quota errors
+        first_row = _appended_row(sheets_call(worksheet.append_rows, rows))
+        _grow_worksheet(worksheet, first_row, len(rows))
+        return first_row
+    
+    def update_cells(self, batch_name, row_index, changes):
+        # Writing the same cells again is harmless, so server errors are retried
+        with_retry(self._worksheet(batch_name).batch_update, _cell_updates(row_index, changes))
+    
+    def student_id_at(self, batch_name, row_index):
+        worksheet = self._worksheet(batch_name)
+        return sheets_call(worksheet.acell, f"{COLUMN_LETTERS['Student ID']}{row_index}").value
+    
+    def delete_row(self, batch_name, row_index):
+        sheets_call(self._worksheet(batch_name).delete_rows, row_index)
+    
+    def delete_batch(self, batch_name):
+        worksheet = self._worksheet(batch_name)
+        link, _ = _worksheets_by_title()[batch_name]
+        requests = [{"deleteSheet": {"sheetId": worksheet.id}}]
+        if len(sheets_call(_open_spreadsheet(link).worksheets)) == 1:
+            # A spreadsheet needs one sheet; an empty manifest is never listed as a batch
+            requests.insert(0, {"addSheet": {"properties": {"title": SHARD_MANIFEST_SHEET}}})
+        sheets_call(_open_spreadsheet(link).batch_update, {"requests": requests})
+        invalidate_worksheet_lists()
+    
+    def modified_time(self, batch_type):
+        # Drive's modifiedTime of every shard, one small metadata request each
+        return "|".join(sheets_call(_open_spreadsheet(link).get_lastUpdateTime) for link in _shard_links(batch_type))
+    
+    def batch_fingerprints(self, batch_type, batches):
+        by_shard = {}
+        for batch in batches:
+            by_shard.setdefault(_batch_shard(batch), []).append(batch)
+        
+        fingerprints = {}
+        for link, shard_batches in by_shard.items():
+            # Name and Student ID, plus Last Updated: two ranges per worksheet
+            step = max(1, BULK_READ_CHUNK // 2)
+            for start in range(0, len(shard_batches), step):
+                chunk = shard_batches[start:start + step]
+                ranges = []
+                for batch in chunk:
+                    ranges += [f"{_sheet_range(batch['name'])}!A:B", f"{_sheet_range(batch['name'])}!J:J"]
+                value_ranges = sheets_call(_open_spreadsheet(link).values_batch_get, ranges).get("valueRanges", [])
+                
+                for i, batch in enumerate(chunk):
+                    names = value_ranges[i * 2].get("values", []) if i * 2 < len(value_ranges) else []
+                    stamps = value_ranges[i * 2 + 1].get("values", []) if i * 2 + 1 < len(value_ranges) else []
+                    rows = []
+                    for row_index in range(2, len(names) + 1):
+                        cells = _numericise_all(names[row_index - 1])
+                        if not cells or not cells[0]:  # Skip empty rows, as loading does
+                            continue
+                        stamp = stamps[row_index - 1] if len(stamps) >= row_index else []
+                        rows.append((row_index, cells[1] if len(cells) > 1 else "",
+                                     _numericise_all(stamp)[0] if stamp else ""))
+                    fingerprints[batch["name"]] = batch_fingerprint(rows)
+        return fingerprints
+
+class MemoryRepository(StudentRepository):
+    """Batches held in this process only; everything is lost on restart"""
+    
+    name = "In-memory"
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = {}
+    
+    def _rows(self, batch_name):
+        if batch_name not in self.batches:
+            raise ValueError(f"Batch '{batch_name}' not found")
+        return self.batches[batch_name]["rows"]
+    
+    def list_batches(self, batch_type):
+        with self.lock:
+            return [{"name": name, "type": batch["type"]}
+                    for name, batch in self.batches.items() if batch["type"] == batch_type]
+    
+    def create_batches(self, batch_names, batch_type):
+        with self.lock:
+            existing = [name for name in batch_names if name in self.batches]
+            if existing:
+                raise ValueError(f"Batch already exists: {', '.join(existing)}")
+            for name in batch_names:
+                self.batches[name] = {"type": batch_type, "rows": []}
+    
+    def load_students(self, batch_type, batches):
+        with self.lock:
+            rows = [(batch, list(self.batches[batch["name"]]["rows"]))
+                    for batch in batches if batch["name"] in self.batches]
+        return [_make_record(row, row_index, batch)
+                for batch, batch_rows in rows for row_index, row in enumerate(batch_rows, start=2)]
+    
+    def append_rows(self, batch, rows):
+        with self.lock:
+            batch_rows = self._rows(batch["name"])
+            first_row = len(batch_rows) + 2
+            batch_rows.extend(list(row) for row in rows)
+            return first_row
+    
+    def _row(self, batch_name, row_index):
+        rows = self._rows(batch_name)
+        if not 2 <= row_index < len(rows) + 2:
+            raise ValueError(f"Row {row_index} does not exist in batch '{batch_name}'")
+        return rows[row_index - 2]
+    
+    def update_cells(self, batch_name, row_index, changes):
+        with self.lock:
+            row = self._row(batch_name, row_index)
+            for header, value in changes.items():
+                row[STUDENT_HEADERS.index(header)] = value
+    
+    def student_id_at(self, batch_name, row_index):
+        with self.lock:
+            return self._row(batch_name, row_index)[STUDENT_HEADERS.index("Student ID")]
+    
+    def delete_row(self, batch_name, row_index):
+        with self.lock:
+            self._row(batch_name, row_index)
+            del self._rows(batch_name)[row_index - 2]
+    
+    def delete_batch(self, batch_name):
+        with self.lock:
+            self._rows(batch_name)
+            del self.batches[batch_name]
+
+STORAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    name TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS students (
+    batch_name TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    "Student Name", "Student ID", "Contact", "Email", "Batch",
+    "Type", "Time", "Year", "Created Date", "Last Updated"
+);
+CREATE INDEX IF NOT EXISTS idx_storage_rows ON students (batch_name, row);
+"""
+
+class SQLiteRepository(StudentRepository):
+    """Batches and students in a local SQLite database"""
+    
+    name = "SQLite"
+    
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.executescript(STORAGE_SCHEMA)
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def _check_row(self, conn, batch_name, row_index):
+        if not conn.execute("SELECT 1 FROM students WHERE batch_name = ? AND row = ?",
+                            (batch_name, row_index)).fetchone():
+            raise ValueError(f"Row {row_index} does not exist in batch '{batch_name}'")
+    
+    def list_batches(self, batch_type):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT name FROM batches WHERE type = ? ORDER BY position", (batch_type,)).fetchall()
+        finally:
+            conn.close()
+        return [{"name": name, "type": batch_type} for name, in rows]
+    
+    def create_batches(self, batch_names, batch_type):
+        conn = self._connect()
+        try:
+            with conn:
+                position = conn.execute("SELECT COALESCE(MAX(position), 0) FROM batches").fetchone()[0]
+                conn.executemany("INSERT INTO batches (name, type, position) VALUES (?, ?, ?)",
+                                 [(name, batch_type, position + offset)
+                                  for offset, name in enumerate(batch_names, start=1)])
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Batch already exists: {', '.join(batch_names)}")
+        finally:
+            conn.close()
+    
+    def load_students(self, batch_type, batches):
+        by_name = {batch["name"]: batch for batch in batches}
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT batch_name, row, {STUDENT_COLUMNS} FROM students "
+                f"WHERE batch_name IN ({', '.join('?' * len(by_name))}) ORDER BY batch_name, row",
+                list(by_name)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [_make_record(values, row_index, by_name[batch_name]) for batch_name, row_index, *values in rows]
+    
+    def append_rows(self, batch, rows):
+        conn = self._connect()
+        try:
+            with conn:
+                if not conn.execute("SELECT 1 FROM batches WHERE name = ?", (batch["name"],)).fetchone():
+                    raise ValueError(f"Batch '{batch['name']}' not found")
+                first_row = conn.execute("SELECT COALESCE(MAX(row), 1) + 1 FROM students WHERE batch_name = ?",
+                                         (batch["name"],)).fetchone()[0]
+                conn.executemany(
+                    f"INSERT INTO students (batch_name, row, {STUDENT_COLUMNS}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(STUDENT_HEADERS))})",
+                    [(batch["name"], first_row + offset, *row) for offset, row in enumerate(rows)]
+                )
+            return first_row
+        finally:
+            conn.close()
+    
+    def update_cells(self, batch_name, row_index, changes):
+        conn = self._connect()
+        try:
+            with conn:
+                self._check_row(conn, batch_name, row_index)
+                conn.execute(
+                    f"UPDATE students SET {', '.join(f'{chr(34)}{header}{chr(34)} = ?' for header in changes)} "
+                    "WHERE batch_name = ? AND row = ?",
+                    [*changes.values(), batch_name, row_index]
+                )
+        finally:
+            conn.close()
+    
+    def student_id_at(self, batch_name, row_index):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT "Student ID" FROM students WHERE batch_name = ? AND row = ?',
+                               (batch_name, row_index)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+    
+    def delete_row(self, batch_name, row_index):
+        conn = self._connect()
+        try:
+            with conn:
+                self._check_row(conn, batch_name, row_index)
+                conn.execute("DELETE FROM students WHERE batch_name = ? AND row = ?", (batch_name, row_index))
+                conn.execute("UPDATE students SET row = row - 1 WHERE batch_name = ? AND row > ?",
+                             (batch_name, row_index))
+        finally:
+            conn.close()
+    
+    def delete_batch(self, batch_name):
+        conn = self._connect()
+        try:
+            with conn:
+                if not conn.execute("DELETE FROM batches WHERE name = ?", (batch_name,)).rowcount:
+                    raise ValueError(f"Batch '{batch_name}' not found")
+                conn.execute("DELETE FROM students WHERE batch_name = ?", (batch_name,))
+        finally:
+            conn.close()
+
+@st.cache_resource
+def get_repository():
+    """The storage backend picked by STORAGE_BACKEND, or None if it is unavailable"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteRepository(STORAGE_PATH)
+    if STORAGE_BACKEND == "memory":
+        return MemoryRepository()
+    return SheetsRepository() if get_gspread_client() else None
+
+# ============================
+# BULK IMPORT
+# ============================
+IMPORT_REQUIRED_COLUMNS = ["Student Name", "Student ID", "Contact", "Email", "Batch", "Time"]
+
+def read_student_file(uploaded_file):
+    """Read an uploaded CSV or Excel file into a DataFrame of strings"""
+    import pandas as pd
+    
+    if uploaded_file.name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(uploaded_file, dtype=str)
+    else:
+        df = pd.read_csv(uploaded_file, dtype=str, keep_default_na=False)
+    df.columns = [str(col).strip() for col in df.columns]
+    return df.fillna("")
+
+def validate_student_rows(df, batches, snapshot=None, write_queue=None):
+    """Check every row of an import at once
+    
+    Returns (valid, report): valid holds (report index, student data, batch)
+    for rows that can be written, and report holds one result dict per row.
+    Unique fields are checked against the snapshot's students and the write
+    queue's uncommitted writes, when given, and against earlier rows of the
+    same file.
+    """
+    missing = [col for col in IMPORT_REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    
+    batches_by_name = {batch["name"]: batch for batch in batches}
+    valid, report = [], []
+    # Skip a query per row when nothing is waiting to be committed
+    counts = write_queue.counts() if write_queue else {}
+    if not counts.get("pending") and not counts.get("sending"):
+        write_queue = None
+    seen = {header: {} for header in UNIQUE_FIELDS}  # header -> value -> first row using it
+    
+    for i, row in enumerate(df.to_dict("records")):
+        row = {key: str(value).strip() for key, value in row.items()}
+        result = {
+            "Row": i + 2,  # Spreadsheet-style row number, after the header
+            "Student Name": row["Student Name"],
+            "Student ID": row["Student ID"],
+            "Batch": row["Batch"],
+            "Status": "Invalid",
+            "Message": ""
+        }
+        report.append(result)
+        
+        if not all(row[col] for col in IMPORT_REQUIRED_COLUMNS):
+            result["Message"] = "Missing required fields"
+        elif not re.match(r"[^@]+@[^@]+\.[^@]+", row["Email"]):
+            result["Message"] = "Invalid email address"
+        elif row["Batch"] not in batches_by_name:
+            result["Message"] = f"Batch '{row['Batch']}' not found"
+        elif row["Time"] not in ["4pm", "6pm"]:
+            result["Message"] = "Time must be 4pm or 6pm"
+        else:
+            clashes = []
+            existing = snapshot.duplicates({header: row[header] for header in UNIQUE_FIELDS}) if snapshot else {}
+            queued = write_queue.duplicates({header: row[header] for header in UNIQUE_FIELDS}) if write_queue else {}
+            values = {header: _unique_value(header, row[header]) for header in UNIQUE_FIELDS}
+            for header, policy in UNIQUE_FIELDS.items():
+                if header in existing:
+                    clashes.append((policy, f"{header} already used in {existing[header][0].batch_name}"))
+                elif header in queued:
+                    clashes.append((policy, f"{header} already queued for {queued[header][0][1]}"))
+                elif values[header] in seen[header]:
+                    clashes.append((policy, f"{header} repeats row {seen[header][values[header]]}"))
+            
+            result["Message"] = "; ".join(message for _, message in clashes)
+            if any(policy == "reject" for policy, _ in clashes):
+                continue
+            
+            for header, value in values.items():
+                if value:
+                    seen[header].setdefault(value, result["Row"])
+            result["Status"] = "Valid"
+            student_data = {
+                "name": row["Student Name"],
+                "student_id": row["Student ID"],
+                "contact": row["Contact"],
+                "email": row["Email"],
+                "time": row["Time"],
+                "year": row.get("Year") or datetime.now().year
+            }
+            valid.append((len(report) - 1, student_data, batches_by_name[row["Batch"]]))
+    
+    return valid, report
+
+def import_students(df):
+    """Validate an import and append its rows batch by batch in chunks
+    
+    Returns a per-row report with the status of every input row.
+    """
+    valid, report = validate_student_rows(df, get_all_batches(), load_roster_snapshot(), get_write_queue())
+    
+    # Group rows by target batch so each chunk is one append request
+    by_batch = {}
+    for report_index, student_data, batch in valid:
+        by_batch.setdefault(batch["name"], (batch, []))[1].append((report_index, student_data))
+    
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for batch, items in by_batch.values():
+        for start in range(0, len(items), IMPORT_CHUNK_SIZE):
+            chunk = items[start:start + IMPORT_CHUNK_SIZE]
+            rows = [_student_row(student_data, batch, timestamp) for _, student_data in chunk]
+            try:
+                first_row = get_repository().append_rows(batch, rows)
+            except Exception as e:
+                for report_index, _ in chunk:
+                    report[report_index]["Status"] = "Failed"
+                    report[report_index]["Message"] = str(e)
+                continue
+            
+            for offset, (report_index, _) in enumerate(chunk):
+                report[report_index]["Status"] = "Added"
+                if first_row is not None:
+                    apply_to_snapshot("add_student", _make_record(rows[offset], first_row + offset, batch))
+            if first_row is None:
+                invalidate_roster_snapshot()
+    
+    return report
+
+# ============================
+# WRITE QUEUE
+# ============================
+WRITE_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    batch_name TEXT NOT NULL,
+    batch_type TEXT,
+    row INTEGER,
+    payload TEXT NOT NULL,
+    label TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    committed_at TEXT,
+    student_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_writes_pending ON writes (status, batch_name, row);
+"""
+
+class WriteQueue:
+    """Persistent queue of student writes, drained by a background worker
+    
+    Pending edits to the same row are coalesced into one write, and each
+    worksheet's queued updates are sent as one batch_update request.
+    Quota and server errors are retried with exponential backoff and jitter.
+    Failed writes stay in the queue until they are retried.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._wake = threading.Event()
+        conn = self._connect()
+        try:
+            conn.executescript(WRITE_QUEUE_SCHEMA)
+            # Queues created before writes carried their Student ID
+            if "student_id" not in [column[1] for column in conn.execute("PRAGMA table_info(writes)")]:
+                conn.execute("ALTER TABLE writes ADD COLUMN student_id TEXT")
+            # Writes interrupted mid-send by a restart are sent again
+            conn.execute("UPDATE writes SET status = 'pending' WHERE status = 'sending'")
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def enqueue(self, op, batch, row_index, payload, label="", student_id=None):
+        """Queue one write; batch is a batch dict for adds, else a batch name
+        
+        Updates and deletes carry the Student ID of the row they address, so
+        the worker can check the row again before sending them.
+        """
+        batch_name = batch["name"] if isinstance(batch, dict) else batch
+        batch_type = batch["type"] if isinstance(batch, dict) else None
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        conn = self._connect()
+        try:
+            if op == "update":
+                pending = conn.execute(
+                    "SELECT id, payload, label FROM writes WHERE status = 'pending' "
+                    "AND op = 'update' AND batch_name = ? AND row = ?",
+                    (batch_name, row_index)
+                ).fetchone()
+                if pending:
+                    # Coalesce with the edit already waiting for this row, unless
+                    # the worker claimed it in the meantime
+                    merged = dict(json.loads(pending[1]), **payload)
+                    cursor = conn.execute(
+                        "UPDATE writes SET payload = ?, label = ? WHERE id = ? AND status = 'pending'",
+                        (json.dumps(merged), label or pending[2], pending[0])
+                    )
+                    conn.commit()
+                    if cursor.rowcount:
+                        return
+            
+            if op == "delete":
+                # A delete makes pending edits of the same row pointless
+                conn.execute(
+                    "UPDATE writes SET status = 'superseded' WHERE status = 'pending' "
+                    "AND op = 'update' AND batch_name = ? AND row = ?",
+                    (batch_name, row_index)
+                )
+            
+            conn.execute(
+                "INSERT INTO writes (op, batch_name, batch_type, row, payload, label, created_at, student_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (op, batch_name, batch_type, row_index, json.dumps(payload), label, now,
+                 None if student_id is None else str(student_id))
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self._wake.set()
+    
+    def pending(self, batch_name):
+        """Number of writes to a batch not committed yet"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM writes WHERE batch_name = ? AND status IN ('pending', 'sending')",
+                                (batch_name,)).fetchone()[0]
+        finally:
+            conn.close()
+    
+    def duplicates(self, values, exclude=None):
+        """{header: [(label, batch name)]} of queued adds and edits using one of values
+        
+        exclude is the (batch name, row) of the student being edited.
+        """
+        wanted = {header: _unique_value(header, value) for header, value in values.items() if header in UNIQUE_FIELDS}
+        wanted = {header: value for header, value in wanted.items() if value}
+        if not wanted:
+            return {}
+        
+        conn = self._connect()
+        try:
+            writes = conn.execute(
+                "SELECT op, batch_name, row, payload, label FROM writes "
+                "WHERE status IN ('pending', 'sending') AND op IN ('add', 'update')"
+            ).fetchall()
+        finally:
+            conn.close()
+        
+        found = {}
+        for op, batch_name, row_index, payload, label in writes:
+            if op == "update" and (batch_name, row_index) == exclude:
+                continue
+            # Adds hold a whole row, updates only the changed fields
+            fields = dict(zip(STUDENT_HEADERS, json.loads(payload))) if op == "add" else json.loads(payload)
+            for header, value in wanted.items():
+                if header in fields and _unique_value(header, fields[header]) == value:
+                    found.setdefault(header, []).append((label or "an edit", batch_name))
+        return found
+    
+    def counts(self):
+        """Number of writes in each status"""
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM writes GROUP BY status").fetchall())
+        finally:
+            conn.close()
+    
+    def recent(self, limit=5):
+        """Most recent writes as (op, batch, label, status, error) tuples"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT op, batch_name, label, status, error FROM writes "
+                "WHERE status != 'superseded' ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+    
+    def retry_failed(self):
+        """Put failed writes back in the queue"""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE writes SET status = 'pending', attempts = 0, next_attempt = 0, "
+                         "error = NULL WHERE status = 'failed'")
+            conn.commit()
+        finally:
+            conn.close()
+        self._wake.set()
+    
+    def run_worker(self):
+        """Body of the background worker thread"""
+        while True:
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                pass
+            self._wake.wait(WRITE_QUEUE_INTERVAL)
+    
+    def drain(self):
+        """Commit every pending write that is due, worksheet by worksheet"""
+        conn = self._connect()
+        try:
+            due = conn.execute(
+                "SELECT id, op, batch_name, batch_type, row, payload, label, student_id FROM writes "
+                "WHERE status = 'pending' ORDER BY id"
+            ).fetchall()
+            if not due:
+                return
+            
+            worksheets = _worksheets_by_title()
+            by_batch = {}
+            for item in due:
+                by_batch.setdefault(item[2], []).append(item)
+            
+            for batch_name, items in by_batch.items():
+                _, worksheet = worksheets.get(batch_name, (None, None))
+                if worksheet is None:
+                    self._fail(conn, [item[0] for item in items], f"Batch '{batch_name}' not found")
+                    continue
+                self._drain_worksheet(conn, worksheet, items)
+        finally:
+            conn.close()
+    
+    def _drain_worksheet(self, conn, worksheet, items):
+        """Commit one worksheet's writes in order, grouping runs of the same op"""
+        # Writes that are backing off hold back everything queued after them
+        backing_off = conn.execute(
+            "SELECT MIN(id) FROM writes WHERE status = 'pending' AND batch_name = ? AND next_attempt > ?",
+            (worksheet.title, time.time())
+        ).fetchone()[0]
+        if backing_off is not None:
+            items = [item for item in items if item[0] < backing_off]
+        
+        i = 0
+        while i < len(items):
+            op = items[i][1]
+            run = [items[i]]
+            if op != "delete":
+                while i + len(run) < len(items) and items[i + len(run)][1] == op:
+                    run.append(items[i + len(run)])
+            
+            try:
+                # Same lock as the app's row lookups, so none sees rows mid-shift
+                with batch_lock(worksheet.title):
+                    self._commit(conn, worksheet, op, run)
+            except Exception as e:
+                self._retry_later(conn, op, run, e)
+                return
+            if op == "delete":
+                # The rest were renumbered in the table; pick them up on the next pass
+                self._wake.set()
+                return
+            i += len(run)
+    
+    def _commit(self, conn, worksheet, op, run):
+        """Send one group of writes and record them as committed"""
+        ids = [item[0] for item in run]
+        
+        # Claim the group so new edits are queued separately, not merged into it
+        conn.executemany("UPDATE writes SET status = 'sending' WHERE id = ?", [(write_id,) for write_id in ids])
+        conn.commit()
+        run = [item[:5] + conn.execute("SELECT payload FROM writes WHERE id = ?", (item[0],)).fetchone() + item[6:]
+               for item in run]
+        
+        if op != "add":
+            run = self._locate(conn, worksheet, run)
+            ids = [item[0] for item in run]
+            if not run:
+                return
+        
+        if op == "add":
+            rows = [json.loads(item[5]) for item in run]
+            response = sheets_call(worksheet.append_rows, rows)
+            first_row = _appended_row(response)
+            _grow_worksheet(worksheet, first_row, len(rows))
+            for offset, item in enumerate(run):
+                batch = {"name": worksheet.title, "type": item[3], "worksheet": worksheet}
+                if first_row is None:
+                    invalidate_roster_snapshot()
+                else:
+                    apply_to_snapshot("add_student", _make_record(rows[offset], first_row + offset, batch))
+        
+        elif op == "update":
+            data = []
+            for item in run:
+                data += _cell_updates(item[4], json.loads(item[5]))
+            sheets_call(worksheet.batch_update, data)
+            for item in run:
+                values = json.loads(item[5])
+                values = dict(zip(values, _numericise_all([str(v) for v in values.values()])))
+                apply_to_snapshot("update_student", worksheet.title, item[4], values)
+        
+        else:
+            row_index = run[0][4]
+            sheets_call(worksheet.delete_rows, row_index)
+            apply_to_snapshot("delete_student", worksheet.title, row_index)
+            
+            # Queued writes were addressed before this delete shifted the rows
+            conn.execute(
+                "UPDATE writes SET status = 'failed', error = 'Student was deleted' "
+                "WHERE status = 'pending' AND batch_name = ? AND row = ? AND id != ?",
+                (worksheet.title, row_index, ids[0])
+            )
+            conn.execute(
+                "UPDATE writes SET row = row - 1 WHERE status = 'pending' AND batch_name = ? AND row > ?",
+                (worksheet.title, row_index)
+            )
+        
+        conn.executemany(
+            "UPDATE writes SET status = 'committed', committed_at = ?, error = NULL WHERE id = ?",
+            [(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), write_id) for write_id in ids]
+        )
+        conn.commit()
+    
+    def _locate(self, conn, worksheet, run):
+        """Writes whose row still holds their student, moved to the student's
+        current row if it has shifted; the rest are marked failed"""
+        if not any(item[7] for item in run):
+            return run
+        
+        column = sheets_call(worksheet.col_values, STUDENT_HEADERS.index("Student ID") + 1)
+        current = [_normalize(value) for value in _numericise_all([str(value) for value in column])]
+        
+        located, failed = [], []
+        for item in run:
+            if not item[7]:
+                located.append(item)
+                continue
+            student_id = _normalize(_numericise_all([item[7]])[0])
+            if item[4] <= len(current) and current[item[4] - 1] == student_id:
+                located.append(item)
+                continue
+            rows = [row for row, value in enumerate(current[1:], start=2) if value == student_id]
+            if len(rows) == 1:
+                conn.execute("UPDATE writes SET row = ? WHERE id = ?", (rows[0], item[0]))
+                located.append(item[:4] + (rows[0],) + item[5:])
+            elif rows:
+                failed.append((f"Student ID {item[7]} appears more than once in this batch", item[0]))
+            else:
+                failed.append((f"Student ID {item[7]} is no longer in this batch", item[0]))
+        
+        conn.executemany("UPDATE writes SET status = 'failed', error = ? WHERE id = ?", failed)
+        conn.commit()
+        return located
+    
+    def _retry_later(self, conn, op, run, error):
+        """Back off a failed group, or mark it failed when it cannot succeed"""
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        retry_codes = APPEND_RETRY_STATUS_CODES if op == "add" else RETRY_STATUS_CODES
+        for item in run:
+            attempts = conn.execute("SELECT attempts FROM writes WHERE id = ?", (item[0],)).fetchone()[0] + 1
+            if status in retry_codes and attempts < MAX_RETRIES:
+                delay = RETRY_BASE_DELAY * 2 ** attempts * random.uniform(0.5, 1.5)
+                conn.execute("UPDATE writes SET status = 'pending', attempts = ?, next_attempt = ?, "
+                             "error = ? WHERE id = ?",
+                             (attempts, time.time() + delay, str(error), item[0]))
+            else:
+                conn.execute("UPDATE writes SET attempts = ?, status = 'failed', error = ? WHERE id = ?",
+                             (attempts, str(error), item[0]))
+        conn.commit()
+    
+    def _fail(self, conn, ids, error):
+        conn.executemany("UPDATE writes SET status = 'failed', error = ? WHERE id = ?",
+                         [(error, write_id) for write_id in ids])
+        conn.commit()
+
+@st.cache_resource(show_spinner=False)
+def _start_write_queue():
+    """Open the write queue and start its worker thread once per process"""
+    write_queue = WriteQueue(WRITE_QUEUE_PATH)
+    threading.Thread(target=write_queue.run_worker, name="write-queue", daemon=True).start()
+    return write_queue
+
+def get_write_queue():
+    """Get the write queue, or None when writes go straight to the sheets"""
+    if not USE_WRITE_QUEUE or not isinstance(get_repository(), SheetsRepository):
+        return None
+    return _start_write_queue()
+
+# ============================
+# LOCAL REPLICA
+# ============================
+REPLICA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    name TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS students (
+    batch_name TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    sync_key TEXT NOT NULL,
+    "Student Name", "Student ID", "Contact", "Email", "Batch",
+    "Type", "Time", "Year", "Created Date", "Last Updated",
+    PRIMARY KEY (batch_name, row)
+);
+CREATE INDEX IF NOT EXISTS idx_students_id ON students ("Student ID");
+CREATE INDEX IF NOT EXISTS idx_students_name ON students ("Student Name" COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_students_batch ON students (batch_name, "Student Name");
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+STUDENT_COLUMNS = ", ".join(f'"{header}"' for header in STUDENT_HEADERS)
+STUDENT_COLUMNS_QUALIFIED = ", ".join(f's."{header}"' for header in STUDENT_HEADERS)
+
+def _sync_key(student_id, last_updated):
+    """Cheap per-row fingerprint built from the Student ID and Last Updated cells"""
+    return f"{student_id}|{last_updated}"
+
+def _row_spans(rows):
+    """Group sorted row numbers into (first, last) runs of consecutive rows"""
+    spans = []
+    for row in sorted(rows):
+        if spans and spans[-1][1] == row - 1:
+            spans[-1][1] = row
+        else:
+            spans.append([row, row])
+    return spans
+
+class StudentReplica:
+    """Local SQLite copy of every batch and student, kept fresh by a sync thread
+    
+    Each sync skips spreadsheets whose Drive modifiedTime is unchanged,
+    reads only the Student ID and Last Updated columns of every worksheet
+    in the others, then fetches the full rows whose values changed since
+    the previous sync.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.last_error = None
+        self._wake = threading.Event()
+        conn = self._connect()
+        try:
+            conn.executescript(REPLICA_SCHEMA)
+            self.version = self._get_state(conn, "version", 0)
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def _get_state(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    
+    def _set_state(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+    
+    def last_sync(self):
+        """Timestamp of the last completed sync, or None"""
+        conn = self._connect()
+        try:
+            return self._get_state(conn, "last_sync")
+        finally:
+            conn.close()
+    
+    def is_ready(self):
+        """Whether the replica holds at least one full sync"""
+        return self.last_sync() is not None
+    
+    # ---- reads ----
+    
+    def read_batches(self):
+        """Read all batches in the same order as get_all_batches()"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT name, type FROM batches ORDER BY position").fetchall()
+        finally:
+            conn.close()
+        
+        worksheets = _worksheets_by_title()
+        batches = []
+        for name, batch_type in rows:
+            link, worksheet = worksheets.get(name, (None, None))
+            batches.append({"name": name, "type": batch_type, "worksheet": worksheet, "shard": link})
+        return batches
+    
+    def read_students(self, batch_filter=None):
+        """Read student records shaped like get_all_students() results"""
+        query = (f"SELECT s.batch_name, b.type, s.row, {STUDENT_COLUMNS_QUALIFIED} "
+                 "FROM students s JOIN batches b ON b.name = s.batch_name")
+        params = ()
+        if batch_filter:
+            query += " WHERE s.batch_name = ?"
+            params = (batch_filter,)
+        query += " ORDER BY b.position, s.row"
+        
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+        
+        return [StudentRecord(*values, row_index, batch_name, batch_type, None)
+                for batch_name, batch_type, row_index, *values in rows]
+    
+    def iter_rows(self, batch_filter=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Stream worksheet column values in display order, chunk_size rows per fetch"""
+        query = f"SELECT {STUDENT_COLUMNS_QUALIFIED} FROM students s JOIN batches b ON b.name = s.batch_name"
+        params = ()
+        if batch_filter:
+            query += " WHERE s.batch_name = ?"
+            params = (batch_filter,)
+        query += " ORDER BY b.position, s.row"
+        
+        conn = self._connect()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    # ---- sync ----
+    
+    def request_sync(self):
+        """Wake the sync thread so it refreshes now instead of at the next interval"""
+        self._wake.set()
+    
+    def run_sync_loop(self):
+        """Body of the background sync thread"""
+        while True:
+            self._wake.clear()
+            try:
+                self.sync()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            self._wake.wait(REPLICA_SYNC_INTERVAL)
+    
+    def sync(self):
+        """Pull changed rows from every spreadsheet into the replica"""
+        changed = False
+        position = 0
+        conn = self._connect()
+        try:
+            for batch_type in BATCH_TYPES:
+                # Spreadsheets Drive reports as unmodified need no diff at all
+                try:
+                    modified = get_repository().modified_time(batch_type)
+                except Exception:
+                    modified = None
+                if modified is not None and modified == self._get_state(conn, f"modified:{batch_type}"):
+                    first, count = conn.execute("SELECT MIN(position), COUNT(*) FROM batches WHERE type = ?",
+                                                (batch_type,)).fetchone()
+                    if count:
+                        conn.execute("UPDATE batches SET position = position - ? + ? WHERE type = ?",
+                                     (first, position, batch_type))
+                    position += count
+                    continue
+                
+                shards = [(link, [ws for ws in sheets_call(_open_spreadsheet(link).worksheets)
+                                  if ws.title != SHARD_MANIFEST_SHEET])
+                          for link in _shard_links(batch_type)]
+                worksheets = [ws for _, shard_worksheets in shards for ws in shard_worksheets]
+                
+                titles = [ws.title for ws in worksheets]
+                stale = conn.execute(
+                    f"SELECT name FROM batches WHERE type = ? AND name NOT IN ({','.join('?' * len(titles))})",
+                    (batch_type, *titles)
+                ).fetchall()
+                for (name,) in stale:
+                    conn.execute("DELETE FROM students WHERE batch_name = ?", (name,))
+                    conn.execute("DELETE FROM batches WHERE name = ?", (name,))
+                    changed = True
+                
+                for ws in worksheets:
+                    conn.execute("INSERT OR REPLACE INTO batches (name, type, position) VALUES (?, ?, ?)",
+                                 (ws.title, batch_type, position))
+                    position += 1
+                
+                # Two column ranges per worksheet, so half a chunk of worksheets per request
+                step = max(1, BULK_READ_CHUNK // 2)
+                for link, shard_worksheets in shards:
+                    spreadsheet = _open_spreadsheet(link)
+                    for start in range(0, len(shard_worksheets), step):
+                        changed |= self._sync_worksheets(conn, spreadsheet, shard_worksheets[start:start + step])
+                self._set_state(conn, f"modified:{batch_type}", modified)
+            
+            if changed:
+                self.version += 1
+                self._set_state(conn, "version", self.version)
+            self._set_state(conn, "last_sync", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            conn.commit()
+        finally:
+            conn.close()
+        return changed
+    
+    def _sync_worksheets(self, conn, spreadsheet, worksheets):
+        """Diff the key columns of some worksheets and refetch the changed rows"""
+        ranges = []
+        for ws in worksheets:
+            ranges += [f"{_sheet_range(ws.title)}!B:B", f"{_sheet_range(ws.title)}!J:J"]
+        value_ranges = sheets_call(spreadsheet.values_batch_get, ranges).get("valueRanges", [])
+        
+        changed = False
+        fetch = {}
+        for i, ws in enumerate(worksheets):
+            ids = value_ranges[i * 2].get("values", [])
+            stamps = value_ranges[i * 2 + 1].get("values", [])
+            remote = {}
+            for row_index in range(2, max(len(ids), len(stamps)) + 1):
+                student_id = ids[row_index - 1][0] if len(ids) >= row_index and ids[row_index - 1] else ""
+                stamp = stamps[row_index - 1][0] if len(stamps) >= row_index and stamps[row_index - 1] else ""
+                if student_id or stamp:
+                    remote[row_index] = _sync_key(student_id, stamp)
+            
+            local = dict(conn.execute("SELECT row, sync_key FROM students WHERE batch_name = ?",
+                                      (ws.title,)).fetchall())
+            removed = [row_index for row_index in local if row_index not in remote]
+            if removed:
+                conn.executemany("DELETE FROM students WHERE batch_name = ? AND row = ?",
+                                 [(ws.title, row_index) for row_index in removed])
+                changed = True
+            
+            rows = {row_index: key for row_index, key in remote.items() if local.get(row_index) != key}
+            if rows:
+                fetch[ws.title] = rows
+        
+        if not fetch:
+            return changed
+        
+        spans = [(title, first, last) for title, rows in fetch.items() for first, last in _row_spans(rows)]
+        response = sheets_call(
+            spreadsheet.values_batch_get,
+            [f"{_sheet_range(title)}!A{first}:J{last}" for title, first, last in spans]
+        )
+        for (title, first, last), value_range in zip(spans, response.get("valueRanges", [])):
+            values = value_range.get("values", [])
+            for offset, row_index in enumerate(range(first, last + 1)):
+                row = _numericise_all(values[offset]) if offset < len(values) else []
+                row += [""] * (len(STUDENT_HEADERS) - len(row))
+                if not row[0]:  # Skip empty rows
+                    conn.execute("DELETE FROM students WHERE batch_name = ? AND row = ?", (title, row_index))
+                    continue
+                conn.execute(
+                    f"INSERT OR REPLACE INTO students (batch_name, row, sync_key, {STUDENT_COLUMNS}) "
+                    f"VALUES (?, ?, ?, {', '.join('?' * len(STUDENT_HEADERS))})",
+                    (title, row_index, fetch[title][row_index], *row[:len(STUDENT_HEADERS)])
+                )
+        return True
+
+@st.cache_resource(show_spinner=False)
+def _start_replica():
+    """Open the replica and start its sync thread once per process"""
+    replica = StudentReplica(REPLICA_PATH)
+    threading.Thread(target=replica.run_sync_loop, name="replica-sync", daemon=True).start()
+    return replica
+
+def get_replica():
+    """Get the local replica, or None when it is disabled"""
+    if not USE_LOCAL_REPLICA or not isinstance(get_repository(), SheetsRepository):
+        return None
+    return _start_replica()
+
+def data_version():
+    """Version of the data behind reads, bumped by every replica sync that changes it"""
+    replica = get_replica()
+    return replica.version if replica else 0
+
+# ============================
+# EXPORT
+# ============================
+def _chunked(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Group an iterable of rows into lists of chunk_size rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _write_csv(path, chunks, open_file=open):
+    with open_file(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(STUDENT_HEADERS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+
+def _write_parquet(path, chunks, compression="snappy"):
+    # pyarrow is always installed alongside streamlit
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    # Sheet columns hold mixed numbers and text, so store everything as text
+    schema = pa.schema([(header, pa.string()) for header in STUDENT_HEADERS])
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for chunk in chunks:
+            columns = [pa.array(["" if value is None else str(value) for value in column], pa.string())
+                       for column in zip(*chunk)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+def _write_xlsx(path, chunks):
+    from openpyxl import Workbook
+    
+    # Write-only workbooks stream rows to disk instead of holding them all
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Students")
+    sheet.append(STUDENT_HEADERS)
+    for chunk in chunks:
+        for row in chunk:
+            sheet.append(list(row))
+    workbook.save(path)
+
+# Format -> (file extension, MIME type, writer, required module)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv", _write_csv, None),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", _write_parquet, "pyarrow"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", _write_xlsx, "openpyxl")
+}
+
+def export_available(export_format):
+    """Whether the module needed for an export format is installed"""
+    module = EXPORT_FORMATS[export_format][3]
+    return module is None or importlib.util.find_spec(module) is not None
+
+def export_students(rows, export_format, cache_key):
+    """Stream rows into an export file, reusing the file already written for cache_key
+    
+    rows is a zero-argument callable returning an iterable of value rows in
+    STUDENT_HEADERS order; it is only called when no cached file exists.
+    Returns the path of the file.
+    """
+    extension, _, writer, _ = EXPORT_FORMATS[export_format]
+    digest = hashlib.sha1(repr((cache_key, export_format)).encode()).hexdigest()[:16]
+    path = os.path.join(EXPORT_DIR, f"students_{digest}.{extension}")
+    if os.path.exists(path):
+        return path
+    
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    writer(temp_path, _chunked(rows()))
+    os.replace(temp_path, path)
+    
+    # Keep only the most recent exports
+    exports = sorted((entry for entry in os.scandir(EXPORT_DIR) if entry.name.startswith("students_")),
+                     key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in exports[EXPORT_CACHE_FILES:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    return path
+
+def export_bytes(rows, export_format, cache_key):
+    """Contents of the export file for cache_key, writing it first if needed"""
+    with open(export_students(rows, export_format, cache_key), "rb") as f:
+        return f.read()
+
+def export_source(snapshot, students, search_query, batch_filter):
+    """(rows callable, cache key) for exporting the current results
+    
+    Unsearched results stream straight from the local replica when it is
+    in use; otherwise they come from the loaded records.
+    """
+    replica = get_replica()
+    if not search_query and replica and replica.is_ready():
+        replica_filter = None if batch_filter == "All Batches" else batch_filter
+        return (lambda: replica.iter_rows(replica_filter),
+                ("replica", replica.version, replica_filter))
+    
+    fields = list(HEADER_FIELDS.values())
+    return (lambda: ([getattr(student, field) for field in fields] for student in students),
+            ("snapshot", snapshot.data_key, search_query, batch_filter))
+
+# ============================
+# ARCHIVE
+# ============================
+# A batch name can be archived more than once (re-created and archived
+# again), so every archive run gets its own id and file
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    file TEXT NOT NULL UNIQUE,
+    students INTEGER NOT NULL,
+    archived_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archive_students (
+    archive_id INTEGER NOT NULL REFERENCES archives (id),
+    row INTEGER NOT NULL,
+    "Student Name", "Student ID", "Contact", "Email",
+    PRIMARY KEY (archive_id, row)
+);
+CREATE INDEX IF NOT EXISTS idx_archive_name ON archive_students ("Student Name" COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_archive_id ON archive_students ("Student ID");
+"""
+
+ARCHIVE_INDEX_COLUMNS = ["Student Name", "Student ID", "Contact", "Email"]
+
+def _read_parquet(path):
+    import pyarrow.parquet as pq
+    
+    table = pq.read_table(path, columns=STUDENT_HEADERS)
+    return [list(row) for row in zip(*(table.column(header).to_pylist() for header in STUDENT_HEADERS))]
+
+def _read_csv_gz(path):
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header row
+        return [row for row in reader]
+
+# Extension -> (writer, reader, required module), most compact first
+ARCHIVE_FORMATS = {
+    "parquet": (lambda path, chunks: _write_parquet(path, chunks, "zstd"), _read_parquet, "pyarrow"),
+    "csv.gz": (lambda path, chunks: _write_csv(path, chunks, gzip.open), _read_csv_gz, None)
+}
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _archived_rows(path):
+    """Value rows of an archive file; the files never change once written"""
+    extension = next(extension for extension in ARCHIVE_FORMATS if path.endswith(f".{extension}"))
+    return ARCHIVE_FORMATS[extension][1](path)
+
+class StudentArchive:
+    """Batches moved out of live storage, one compressed file each
+    
+    Files hold every column in row order. A SQLite index of the columns
+    people search by says which file and row each student is in, so a
+    search only opens the files it matched.
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "index.db")
+        conn = self._connect()
+        try:
+            conn.executescript(ARCHIVE_SCHEMA)
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def batches(self):
+        """Archived batches as dicts, most recently archived first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, name, type, file, students, archived_at FROM archives "
+                                "ORDER BY id DESC").fetchall()
+        finally:
+            conn.close()
+        return [{"id": archive_id, "name": name, "type": batch_type, "file": os.path.join(self.directory, file),
+                 "students": students, "archived_at": archived_at}
+                for archive_id, name, batch_type, file, students, archived_at in rows]
+    
+    def add(self, batch, records, remove_live):
+        """Write a batch's records to a file and index them, then call remove_live()
+        
+        The index entry is only committed once remove_live() succeeds, so a
+        batch is never live and archived at the same time.
+        """
+        extension = next(extension for extension, (_, _, module) in ARCHIVE_FORMATS.items()
+                         if module is None or importlib.util.find_spec(module) is not None)
+        writer, reader, _ = ARCHIVE_FORMATS[extension]
+        now = datetime.now()
+        file = (f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', batch['name'])}_{now.strftime('%Y%m%d%H%M%S')}_"
+                f"{uuid.uuid4().hex[:8]}.{extension}")
+        path = os.path.join(self.directory, file)
+        
+        # Never overwrite an earlier archive, on disk or in the index
+        conn = self._connect()
+        try:
+            taken = conn.execute("SELECT 1 FROM archives WHERE file = ?", (file,)).fetchone()
+        finally:
+            conn.close()
+        if taken or os.path.exists(path):
+            raise ValueError(f"archive file {file} already exists")
+        
+        fields = list(HEADER_FIELDS.values())
+        rows = [[getattr(record, field) for field in fields] for record in sorted(records, key=lambda r: r.row)]
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        writer(temp_path, _chunked(rows))
+        try:
+            # Read it back before anything is deleted
+            if len(reader(temp_path)) != len(rows):
+                raise ValueError(f"archive file for '{batch['name']}' did not read back correctly")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        # From here on path is this call's own file, safe to remove on failure
+        conn = self._connect()
+        try:
+            with conn:
+                archive_id = conn.execute(
+                    "INSERT INTO archives (name, type, file, students, archived_at) VALUES (?, ?, ?, ?, ?)",
+                    (batch["name"], batch["type"], file, len(rows), now.strftime("%Y-%m-%d %H:%M:%S"))
+                ).lastrowid
+                positions = [STUDENT_HEADERS.index(header) for header in ARCHIVE_INDEX_COLUMNS]
+                conn.executemany(
+                    f"INSERT INTO archive_students (archive_id, row, "
+                    f"{', '.join(chr(34) + header + chr(34) for header in ARCHIVE_INDEX_COLUMNS)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(ARCHIVE_INDEX_COLUMNS))})",
+                    [(archive_id, row_index, *(row[position] for position in positions))
+                     for row_index, row in enumerate(rows, start=2)]
+                )
+                remove_live()
+        except Exception:
+            os.remove(path)
+            raise
+        finally:
+            conn.close()
+    
+    def search(self, query, limit=200):
+        """Archived students whose name, Student ID, contact or email contains query"""
+        pattern = f"%{query.strip()}%"
+        conn = self._connect()
+        try:
+            matches = conn.execute(
+                "SELECT a.name, a.type, a.file, s.row FROM archive_students s "
+                "JOIN archives a ON a.id = s.archive_id "
+                'WHERE s."Student Name" LIKE ? OR s."Student ID" LIKE ? OR s."Contact" LIKE ? OR s."Email" LIKE ? '
+                "ORDER BY a.id DESC, s.row LIMIT ?",
+                (pattern, pattern, pattern, pattern, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        
+        records = []
+        for batch_name, batch_type, file, row_index in matches:
+            try:
+                rows = _archived_rows(os.path.join(self.directory, file))
+            except OSError:
+                # A file removed by hand; its students can no longer be shown
+                continue
+            batch = {"name": batch_name, "type": batch_type}
+            records.append(_make_record(rows[row_index - 2], row_index, batch))
+        return records
+
+@st.cache_resource(show_spinner=False)
+def get_archive():
+    return StudentArchive(ARCHIVE_DIR)
+
+def batches_of_year(snapshot, year):
+    """Names of the batches whose students all have the given Year"""
+    years = {}
+    for record in snapshot.students:
+        years.setdefault(record.batch_name, set()).add(str(record.year))
+    return [batch["name"] for batch in snapshot.batches if years.get(batch["name"]) == {str(year)}]
+
+def archive_batches(batch_names):
+    """Move batches into the archive and out of live storage
+    
+    Returns the names of the batches that were archived.
+    """
+    archive = get_archive()
+    write_queue = get_write_queue()
+    batches = {batch["name"]: batch for batch in get_all_batches()}
+    archived = []
+    for batch_name in batch_names:
+        try:
+            if batch_name not in batches:
+                raise ValueError("batch not found")
+            if write_queue and write_queue.pending(batch_name):
+                raise ValueError("it still has unsaved changes; try again once they are committed")
+            
+            # Read straight from storage, not from a possibly stale snapshot
+            batch = batches[batch_name]
+            records = get_repository().load_students(batch["type"], [batch])
+            archive.add(batch, records, lambda: get_repository().delete_batch(batch_name))
+            archived.append(batch_name)
+        except Exception as e:
+            st.error(f"❌ Error archiving {batch_name}: {str(e)}")
+    
+    if archived:
+        invalidate_roster_snapshot()
+    return archived
+
+# ============================
+# ROSTER PDFs
+# ============================
+PDF_KINDS = {"Roster": "roster", "Attendance Sheet": "attendance"}
+
+def _pdf_path(prefix, digest):
+    return os.path.join(PDF_DIR, f"{prefix}_{digest}.pdf")
+
+def _store_pdf(prefix, digest, data):
+    """Save a rendered PDF and drop older renderings with the same prefix"""
+    os.makedirs(PDF_DIR, exist_ok=True)
+    path = _pdf_path(prefix, digest)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    
+    for entry in os.scandir(PDF_DIR):
+        stale_digest = entry.name[len(prefix) + 1:-len(".pdf")]
+        if (entry.name.startswith(f"{prefix}_") and entry.name.endswith(".pdf")
+                and len(stale_digest) == 16 and stale_digest != digest):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return path
+
+def batch_pdf_jobs(snapshot, kind, batch_names=None):
+    """(prefix, digest, batch, rows) for rendering each batch's PDF
+    
+    The digest covers each student's ID and Last Updated, so a batch's PDF
+    is only rendered again after a student in it is added, edited or removed.
+    """
+    students_by_batch = {}
+    for student in sorted(snapshot.students, key=lambda student: student.row):
+        students_by_batch.setdefault(student.batch_name, []).append(student)
+    
+    jobs = []
+    for batch in snapshot.batches:
+        if batch_names is not None and batch["name"] not in batch_names:
+            continue
+        students = students_by_batch.get(batch["name"], [])
+        digest = hashlib.sha1(repr((kind, batch["name"], [(student.student_id, student.last_updated)
+                                                           for student in students])).encode()).hexdigest()[:16]
+        # Plain values only, so jobs can be sent to worker processes
+        details = {
+            "name": batch["name"],
+            "type": batch["type"],
+            "students": len(students),
+            "time": students[0].time if students else "",
+            "year": students[0].year if students else ""
+        }
+        rows = sorted(((student.name, student.student_id, student.contact, student.email) for student in students),
+                      key=lambda row: str(row[0]).lower())
+        prefix = f"{re.sub(r'[^A-Za-z0-9-]+', '_', batch['name'])}_{kind}"
+        jobs.append((prefix, digest, details, rows))
+    return jobs
+
+@st.cache_resource(show_spinner=False)
+def _pdf_pool():
+    """Worker processes for PDF rendering, started once per process
+    
+    Spawned, not forked: a fork of the threaded server can copy locks other
+    threads hold into the child and deadlock it. Spawning is slow, so the
+    pool is kept for the next print.
+    """
+    return ProcessPoolExecutor(max_workers=PDF_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def render_batch_pdfs(kind, jobs):
+    """Render every job without a cached PDF and return all of their paths"""
+    import roster_pdf
+    
+    stale = [job for job in jobs if not os.path.exists(_pdf_path(job[0], job[1]))]
+    
+    rendered = None
+    if PARALLEL_PDF and len(stale) > 1:
+        try:
+            rendered = list(_pdf_pool().map(roster_pdf.render_batch, [kind] * len(stale),
+                                            [job[2] for job in stale], [job[3] for job in stale]))
+        except (OSError, RuntimeError):
+            # Hosts without process support fall back to rendering in this
+            # process; a broken pool is started afresh next time
+            _pdf_pool.clear()
+            rendered = None
+    if rendered is None:
+        rendered = [roster_pdf.render_batch(kind, job[2], job[3]) for job in stale]
+    
+    for (prefix, digest, _, _), data in zip(stale, rendered):
+        _store_pdf(prefix, digest, data)
+    return [_pdf_path(prefix, digest) for prefix, digest, _, _ in jobs]
+
+def batch_pdf(snapshot, kind, batch_name):
+    """PDF bytes for one batch, from the cache when it is current"""
+    path, = render_batch_pdfs(kind, batch_pdf_jobs(snapshot, kind, {batch_name}))
+    with open(path, "rb") as f:
+        return f.read()
+
+def all_batches_pdf(snapshot, kind):
+    """Path of one PDF with every batch, merged from the per-batch PDFs"""
+    import roster_pdf
+    
+    jobs = batch_pdf_jobs(snapshot, kind)
+    paths = render_batch_pdfs(kind, jobs)
+    
+    prefix = f"all-batches_{kind}"
+    digest = hashlib.sha1(repr([job[1] for job in jobs]).encode()).hexdigest()[:16]
+    path = _pdf_path(prefix, digest)
+    if not os.path.exists(path):
+        path = _store_pdf(prefix, digest, roster_pdf.merge_pdfs(paths))
+    return path
+
+# ============================
+# SEARCH INDEX
+# ============================
+def _normalize(text):
+    """Lowercase and trim a value for indexing"""
+    return str(text).strip().lower()
+
+def _trigrams(text):
+    """Character trigrams of a padded string, for fuzzy matching"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class StudentSearchIndex:
+    """In-memory index over student names and IDs
+    
+    Supports exact Student ID lookup through a dict, prefix matching of IDs
+    and name words through a sorted term list, and ranked fuzzy name
+    matching through a trigram index. Records are referenced by key and can
+    be added or removed one at a time.
+    """
+    
+    def __init__(self):
+        self._ids = {}        # normalized Student ID -> set of keys
+        self._terms = []      # sorted (term, key) pairs for prefix search
+        self._grams = {}      # trigram -> set of keys
+        self._names = {}      # key -> normalized name
+        self._entries = {}    # key -> (student id, terms, trigrams)
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def add(self, key, record):
+        """Index one record under key"""
+        for term in self._index(key, record):
+            insort(self._terms, (term, key))
+    
+    def add_many(self, items):
+        """Index (key, record) pairs, sorting the term list once at the end"""
+        for key, record in items:
+            self._terms.extend((term, key) for term in self._index(key, record))
+        self._terms.sort()
+    
+    def _index(self, key, record):
+        """Index a record everywhere but the term list; returns its terms"""
+        student_id = _normalize(record.student_id)
+        name = _normalize(record.name)
+        terms = set(name.split())
+        if student_id:
+            terms.add(student_id)
+        grams = _trigrams(name)
+        
+        self._ids.setdefault(student_id, set()).add(key)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(key)
+        self._names[key] = name
+        self._entries[key] = (student_id, terms, grams)
+        return terms
+    
+    def remove(self, key):
+        """Drop a record from the index"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        student_id, terms, grams = entry
+        
+        self._ids.get(student_id, set()).discard(key)
+        for term in terms:
+            i = bisect_left(self._terms, (term, key))
+            if i < len(self._terms) and self._terms[i] == (term, key):
+                del self._terms[i]
+        for gram in grams:
+            self._grams.get(gram, set()).discard(key)
+        del self._names[key]
+    
+    def update(self, key, record):
+        """Re-index a record whose name or ID changed"""
+        self.remove(key)
+        self.add(key, record)
+    
+    def lookup_id(self, student_id):
+        """Keys of records with exactly this Student ID"""
+        return set(self._ids.get(_normalize(student_id), ()))
+    
+    def prefix(self, text):
+        """Keys of records with an ID or name word starting with text"""
+        text = _normalize(text)
+        keys = set()
+        i = bisect_left(self._terms, (text,))
+        while i < len(self._terms) and self._terms[i][0].startswith(text):
+            keys.add(self._terms[i][1])
+            i += 1
+        return keys
+    
+    def fuzzy(self, text, min_score=0.3):
+        """(score, key) pairs of names similar to text, best first"""
+        grams = _trigrams(_normalize(text))
+        overlap = Counter()
+        for gram in grams:
+            for key in self._grams.get(gram, ()):
+                overlap[key] += 1
+        
+        scored = []
+        for key, shared in overlap.items():
+            score = shared / (len(grams) + len(self._entries[key][2]) - shared)
+            if score >= min_score:
+                scored.append((score, key))
+        scored.sort(reverse=True)
+        return scored
+    
+    def search(self, query):
+        """Keys matching query, ranked: exact ID, then prefix, else fuzzy name"""
+        query = _normalize(query)
+        if not query:
+            return []
+        
+        ranked = sorted(self.lookup_id(query))
+        seen = set(ranked)
+        
+        # All words of a multi-word query must prefix-match
+        words = query.split()
+        prefix_keys = self.prefix(words[0])
+        for word in words[1:]:
+            prefix_keys &= self.prefix(word)
+        for key in sorted(prefix_keys - seen, key=lambda k: self._names[k]):
+            ranked.append(key)
+            seen.add(key)
+        
+        # Fall back to fuzzy name matching only when nothing matched directly
+        if not ranked:
+            ranked = [key for _, key in self.fuzzy(query)]
+        
+        return ranked
+
+# ============================
+# ROW INDEX
+# ============================
+class RowIndex:
+    """Student ID -> current row for every worksheet, with a version per worksheet
+    
+    A worksheet gets a new version whenever its rows shift (a delete), so a
+    record read at the current version can be written at its stored row
+    without reading the sheet again.
+    """
+    
+    def __init__(self, new_version):
+        self._new_version = new_version
+        self._rows = {}      # batch name -> {normalized Student ID: set of rows}
+        self._versions = {}  # batch name -> version
+    
+    def version(self, batch_name):
+        if batch_name not in self._versions:
+            self._versions[batch_name] = self._new_version()
+        return self._versions[batch_name]
+    
+    def add(self, batch_name, student_id, row_index):
+        self.version(batch_name)
+        self._rows.setdefault(batch_name, {}).setdefault(_normalize(student_id), set()).add(row_index)
+    
+    def remove(self, batch_name, student_id, row_index):
+        self._rows.get(batch_name, {}).get(_normalize(student_id), set()).discard(row_index)
+    
+    def row_deleted(self, batch_name, row_index):
+        """Shift rows below a deleted row up by one and bump the version"""
+        for rows in self._rows.get(batch_name, {}).values():
+            shifted = {row - 1 if row > row_index else row for row in rows if row != row_index}
+            rows.clear()
+            rows.update(shifted)
+        self._versions[batch_name] = self._new_version()
+    
+    def resolve(self, batch_name, row_index, student_id, version):
+        """Row to write for a record read at the given version
+        
+        Without a version the row is taken as given, but must hold the student.
+        """
+        if version is not None and version == self._versions.get(batch_name):
+            return row_index
+        
+        rows = self._rows.get(batch_name, {}).get(_normalize(student_id), set())
+        if version is None:
+            if row_index in rows:
+                return row_index
+            raise ValueError(f"Row {row_index} of batch '{batch_name}' does not hold Student ID {student_id}")
+        if len(rows) == 1:
+            return next(iter(rows))
+        if not rows:
+            raise ValueError(f"Student ID {student_id} is no longer in batch '{batch_name}'")
+        raise ValueError(f"Student ID {student_id} appears more than once in batch '{batch_name}'")
+
+# ============================
+# UNIQUENESS INDEX
+# ============================
+def _unique_value(header, value):
+    """Form of a value compared for duplicates, or "" when it is blank"""
+    if header == "Contact":
+        # Compare the last 10 digits, so +8801712345678 matches 01712345678
+        return re.sub(r"\D", "", str(value))[-10:]
+    return _normalize(value)
+
+class UniquenessIndex:
+    """Which records hold each UNIQUE_FIELDS value, across all batches"""
+    
+    def __init__(self):
+        self._holders = {header: {} for header in UNIQUE_FIELDS}  # header -> value -> set of keys
+        self._entries = {}                                         # key -> {header: value}
+    
+    def add(self, key, record):
+        entry = {}
+        for header in UNIQUE_FIELDS:
+            value = _unique_value(header, record.get(header, ""))
+            if value:
+                self._holders[header].setdefault(value, set()).add(key)
+                entry[header] = value
+        self._entries[key] = entry
+    
+    def remove(self, key):
+        for header, value in self._entries.pop(key, {}).items():
+            holders = self._holders[header].get(value)
+            if holders is not None:
+                holders.discard(key)
+                if not holders:
+                    del self._holders[header][value]
+    
+    def update(self, key, record):
+        self.remove(key)
+        self.add(key, record)
+    
+    def conflicts(self, values):
+        """{header: keys} of the records already holding any of values"""
+        found = {}
+        for header, value in values.items():
+            if header not in UNIQUE_FIELDS:
+                continue
+            keys = self._holders[header].get(_unique_value(header, value))
+            if keys:
+                found[header] = set(keys)
+        return found
+
+# ============================
+# ROSTER SNAPSHOT
+# ============================
+# Student counts kept in the snapshot stats: stats key -> record attribute
+STUDENT_AGGREGATES = {
+    "students_by_type": "batch_type",
+    "students_by_batch": "batch_name",
+    "students_by_year": "year",
+    "students_by_time": "time"
+}
+
+def _created_month(record):
+    """YYYY-MM of a student's Created Date, or None if it has none"""
+    match = re.match(r"\d{4}-\d{2}", str(record.created_date))
+    return match.group(0) if match else None
+
+def count_student(stats, record, delta):
+    """Add a student to (delta=1) or remove one from (delta=-1) every aggregate"""
+    stats["total_students"] += delta
+    groups = {key: str(getattr(record, attribute)) for key, attribute in STUDENT_AGGREGATES.items()}
+    groups["students_by_month"] = _created_month(record)
+    for key, group in groups.items():
+        if group is None:
+            continue
+        counts = stats[key]
+        counts[group] = counts.get(group, 0) + delta
+        # Empty batches keep their zero; other groups disappear when empty
+        if counts[group] <= 0 and key != "students_by_batch":
+            del counts[group]
+
+def build_roster_stats(batches, students):
+    """Precompute the dashboard and analytics aggregates for a snapshot"""
+    stats = {
+        "total_batches": len(batches),
+        "total_students": 0,
+        "batches_by_type": Counter(batch["type"] for batch in batches),
+        "students_by_type": Counter(),
+        "students_by_batch": {batch["name"]: 0 for batch in batches},
+        "students_by_year": {},
+        "students_by_time": {},
+        "students_by_month": {}
+    }
+    for student in students:
+        count_student(stats, student, 1)
+    return stats
+
+def batch_fingerprint(rows):
+    """(students, newest Last Updated, digest) of (row, Student ID, Last Updated) tuples
+    
+    Adding, deleting or editing a student through the app changes it.
+    """
+    digest = hashlib.sha1()
+    newest = ""
+    count = 0
+    for row_index, student_id, last_updated in rows:
+        digest.update(f"{row_index}|{student_id}|{last_updated}\n".encode("utf-8"))
+        newest = max(newest, str(last_updated))
+        count += 1
+    return count, newest, digest.hexdigest()
+
+class RosterSnapshot:
+    """Every batch and student loaded at one point in time, plus derived views
     
-    # Find the batch
-    for batch in batches:
-        if batch["name"] == batch_name:
-            target_batch = batch
-            break
+    Writes made through this app are applied in place, so the stats and the
+    search index stay current without reloading the sheets.
+    """
     
-    if not target_batch:
-        st.error(f"❌ Batch '{batch_name}' not found")
-        return False
+    def __init__(self, batches, students, version=0, new_row_version=None, generation=0):
+        self.batches = batches
+        self.version = version
+        self.generation = generation
+        self.revision = 0
+        self.refreshed_at = datetime.now()
+        self.loaded_at = self.refreshed_at
+        # Storage modified_time() of each batch type when the data was read
+        self.modified = {}
+        self.lock = threading.RLock()
+        self.records = {}
+        self._rows = {}  # batch name -> {row: key}, so writes find their record directly
+        self.index = StudentSearchIndex()
+        self.unique = UniquenessIndex()
+        self.row_index = RowIndex(new_row_version or itertools.count(1).__next__)
+        self._next_key = 0
+        for student in students:
+            self._insert(student, search=False)
+        # One sort for the whole roster rather than an insort per student
+        self.index.add_many(self.records.items())
+        self.stats = build_roster_stats(batches, students)
     
-    try:
-        worksheet = target_batch["worksheet"]
-        
-        # Prepare student record
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        record = [
-            student_data["name"],
-            student_data["student_id"],
-            student_data["contact"],
-            student_data["email"],
-            batch_name,
-            target_batch["type"],
-            student_data["time"],
-            student_data.get("year", datetime.now().year),
-            timestamp,  # Created Date
-            timestamp   # Last Updated (same as created for new)
-        ]
-        
-        # Add to worksheet
-        worksheet.append_row(record)
-        return True
+    @property
+    def students(self):
+        return list(self.records.values())
+    
+    @property
+    def data_key(self):
+        """Changes whenever the snapshot's data does (reload or in-place write)"""
+        return (self.generation, self.revision)
+    
+    def _insert(self, record, search=True):
+        key = self._next_key
+        self._next_key += 1
+        record.key = key
+        self.records[key] = record
+        self._rows.setdefault(record.batch_name, {})[record.row] = key
+        if search:
+            self.index.add(key, record)
+        self.unique.add(key, record)
+        self.row_index.add(record.batch_name, record.student_id, record.row)
+        return key
+    
+    def _find(self, batch_name, row_index):
+        key = self._rows.get(batch_name, {}).get(row_index)
+        if key is None:
+            raise KeyError((batch_name, row_index))
+        return key
+    
+    def search(self, query):
+        """Records matching query, best match first"""
+        with self.lock:
+            return [self.records[key] for key in self.index.search(query)]
+    
+    def fingerprints(self):
+        """{batch name: batch_fingerprint()} of the students as held here"""
+        with self.lock:
+            rows = {batch["name"]: [] for batch in self.batches}
+            for record in self.records.values():
+                rows.setdefault(record.batch_name, []).append((record.row, record.student_id, record.last_updated))
+        return {name: batch_fingerprint(sorted(batch_rows)) for name, batch_rows in rows.items()}
+    
+    def aggregates(self):
+        """A consistent copy of the stats, for drawing outside the lock"""
+        with self.lock:
+            return {key: dict(value) if isinstance(value, dict) else value for key, value in self.stats.items()}
+    
+    def duplicates(self, values, exclude=None):
+        """{header: records} of other students already holding one of values
         
-    except Exception as e:
-        st.error(f"❌ Error adding student: {str(e)}")
-        return False
-
-def get_all_students(batch_filter=None):
-    """Get all students from all batches, optionally filtered by batch"""
-    all_students = []
-    batches = get_all_batches()
+        exclude is the (batch name, row) of the student being edited.
+        """
+        with self.lock:
+            found = {}
+            for header, keys in self.unique.conflicts(values).items():
+                records = [self.records[key] for key in keys
+                           if (self.records[key].batch_name, self.records[key].row) != exclude]
+                if records:
+                    found[header] = records
+            return found
     
-    for batch in batches:
-        if batch_filter and batch["name"] != batch_filter:
-            continue
+    def add_student(self, record):
+        with self.lock:
+            self._insert(record)
+            self.revision += 1
+            count_student(self.stats, record, 1)
+    
+    def update_student(self, batch_name, row_index, values):
+        with self.lock:
+            key = self._find(batch_name, row_index)
+            record = self.records[key]
+            self.row_index.remove(batch_name, record.student_id, row_index)
             
-        try:
-            worksheet = batch["worksheet"]
-            records = worksheet.get_all_records()
+            # Year and Time are editable, so move the student between groups
+            count_student(self.stats, record, -1)
+            record.update(values)
+            count_student(self.stats, record, 1)
+            self.revision += 1
+            self.row_index.add(batch_name, record.student_id, row_index)
+            self.index.update(key, record)
+            self.unique.update(key, record)
+    
+    def delete_student(self, batch_name, row_index):
+        with self.lock:
+            key = self._find(batch_name, row_index)
+            record = self.records.pop(key)
+            self.index.remove(key)
+            self.unique.remove(key)
+            self.row_index.row_deleted(batch_name, row_index)
+            self.revision += 1
+            count_student(self.stats, record, -1)
             
-            for i, record in enumerate(records, start=2):  # start=2 because row 1 is header
-                if record.get("Student Name"):  # Skip empty rows
-                    record["_row"] = i  # Store row number for editing
-                    record["_batch_name"] = batch["name"]
-                    record["_batch_type"] = batch["type"]
-                    record["_worksheet"] = worksheet
-                    all_students.append(record)
-                    
-        except Exception as e:
-            continue
+            # Rows below the deleted one move up by one
+            rows = self._rows[batch_name]
+            del rows[row_index]
+            shifted = {}
+            for row, other_key in rows.items():
+                if row > row_index:
+                    row -= 1
+                    self.records[other_key].row = row
+                shifted[row] = other_key
+            self._rows[batch_name] = shifted
+
+class RosterStore:
+    """Process-wide holder for the current snapshot"""
     
-    return all_students
+    def __init__(self):
+        self.snapshot = None
+        self.lock = threading.Lock()
+        # Row index versions keep increasing across reloads, so a record read
+        # from an older snapshot never matches a newer version by accident
+        self.next_row_version = itertools.count(1).__next__
+        # Generations are unique to this process: exports in EXPORT_DIR and API
+        # ETags outlive it, and a restarted count would match their stale keys
+        process = uuid.uuid4().hex[:12]
+        generations = itertools.count(1)
+        self.next_generation = lambda: f"{process}-{next(generations)}"
 
-def update_student(row_index, worksheet, updated_data):
-    """Update student information"""
+@st.cache_resource(show_spinner=False)
+def _roster_store():
+    return RosterStore()
+
+def _modified_times():
+    """{batch type: storage modified_time()}, or None if the backend cannot tell"""
+    repository = get_repository()
     try:
-        # Get current row
-        row = worksheet.row_values(row_index)
-        
-        # Update fields
-        updated_row = [
-            updated_data.get("Student Name", row[0]),
-            updated_data.get("Student ID", row[1]),
-            updated_data.get("Contact", row[2]),
-            updated_data.get("Email", row[3]),
-            row[4],  # Batch name (don't change)
-            row[5],  # Batch type (don't change)
-            updated_data.get("Time", row[6]),
-            updated_data.get("Year", row[7]),
-            row[8],  # Created Date (don't change)
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Update timestamp
-        ]
-        
-        # Update the row
-        worksheet.update(f"A{row_index}:J{row_index}", [updated_row])
-        return True
-        
-    except Exception as e:
-        st.error(f"❌ Error updating student: {str(e)}")
-        return False
+        modified = {batch_type: repository.modified_time(batch_type) for batch_type in BATCH_TYPES}
+    except Exception:
+        return None
+    return modified if None not in modified.values() else None
 
-def delete_student(row_index, worksheet):
-    """Delete a student record"""
+def _refresh_snapshot(store, snapshot, modified):
+    """New snapshot that reloads only the batches changed since snapshot was read
+    
+    Returns snapshot itself when nothing changed, or None when the changes
+    cannot be narrowed down and everything must be reloaded.
+    """
+    changed_types = [batch_type for batch_type in BATCH_TYPES
+                     if modified[batch_type] != snapshot.modified.get(batch_type)]
+    if not changed_types:
+        snapshot.refreshed_at = datetime.now()
+        return snapshot
+    
+    # New or removed worksheets only show up in a fresh list
+    invalidate_worksheet_lists()
+    repository = get_repository()
+    held = snapshot.fingerprints()
+    batches = []
+    changed = []
     try:
-        # Clear the row (preserves formatting)
-        worksheet.delete_rows(row_index)
-        return True
-    except Exception as e:
-        st.error(f"❌ Error deleting student: {str(e)}")
-        return False
+        for batch_type in BATCH_TYPES:
+            if batch_type not in changed_types:
+                batches += [batch for batch in snapshot.batches if batch["type"] == batch_type]
+                continue
+            type_batches = repository.list_batches(batch_type)
+            remote = repository.batch_fingerprints(batch_type, type_batches)
+            if remote is None:
+                return None
+            batches += type_batches
+            changed += [batch for batch in type_batches if remote.get(batch["name"]) != held.get(batch["name"])]
+    except Exception:
+        return None
+    
+    if not changed and [batch["name"] for batch in batches] == [batch["name"] for batch in snapshot.batches]:
+        # Only our own writes, already applied in place
+        snapshot.modified = modified
+        snapshot.refreshed_at = datetime.now()
+        return snapshot
+    
+    students = {}
+    for record in snapshot.students:
+        students.setdefault(record.batch_name, []).append(replace(record, key=None))
+    if changed:
+        for batch in changed:
+            students[batch["name"]] = []
+        for record in get_all_students(batches=changed):
+            students[record.batch_name].append(record)
+    
+    refreshed = RosterSnapshot(batches, [record for batch in batches for record in students.get(batch["name"], [])],
+                               snapshot.version, store.next_row_version, store.next_generation())
+    refreshed.modified = modified
+    refreshed.loaded_at = snapshot.loaded_at
+    return refreshed
+
+def load_roster_snapshot():
+    """Get the shared snapshot, loading it once per TTL window or data version
+    
+    When the TTL runs out, only the batches that changed are read again.
+    """
+    store = _roster_store()
+    with store.lock:
+        snapshot = store.snapshot
+        version = data_version()
+        now = datetime.now()
+        if (snapshot is None or snapshot.version != version
+                or (now - snapshot.refreshed_at).total_seconds() > SHEETS_CACHE_TTL):
+            with st.spinner("Loading students..."):
+                refreshed = None
+                # Read before the data, so a write landing in between shows up next time
+                modified = _modified_times() if get_replica() is None else None
+                if (modified and snapshot is not None and snapshot.version == version
+                        and (now - snapshot.loaded_at).total_seconds() <= SNAPSHOT_FULL_RELOAD):
+                    refreshed = _refresh_snapshot(store, snapshot, modified)
+                
+                if refreshed is None:
+                    batches = get_all_batches()
+                    students = get_all_students(batches=batches)
+                    refreshed = RosterSnapshot(batches, students, version, store.next_row_version,
+                                               store.next_generation())
+                    refreshed.modified = modified or {}
+            snapshot = store.snapshot = refreshed
+    return snapshot
+
+def invalidate_roster_snapshot():
+    """Drop the shared snapshot so the next read reloads it"""
+    _roster_store().snapshot = None
+    
+    # Pick up the write in the replica without waiting for the next interval
+    replica = get_replica()
+    if replica:
+        replica.request_sync()
+
+def apply_to_snapshot(method, *args):
+    """Apply a write to the shared snapshot in place, or drop it if that fails"""
+    snapshot = _roster_store().snapshot
+    if snapshot is not None:
+        try:
+            getattr(snapshot, method)(*args)
+        except Exception:
+            _roster_store().snapshot = None
+    
+    replica = get_replica()
+    if replica:
+        replica.request_sync()
 
 # ============================
 # UI COMPONENTS
@@ -283,6 +3245,73 @@ def show_navigation():
             st.rerun()
     st.markdown("---")
 
+def show_write_queue_status():
+    """Show pending/committed write status in the sidebar"""
+    write_queue = get_write_queue()
+    if not write_queue:
+        return
+    
+    counts = write_queue.counts()
+    with st.sidebar:
+        st.subheader("📝 Saved Changes")
+        st.caption(f"Pending: {counts.get('pending', 0)} • "
+                   f"Committed: {counts.get('committed', 0)} • "
+                   f"Failed: {counts.get('failed', 0)}")
+        
+        icons = {"pending": "🕒", "committed": "✅", "failed": "❌"}
+        for op, batch_name, label, status, error in write_queue.recent():
+            st.text(f"{icons.get(status, '•')} {op} {label or ''} ({batch_name})")
+            if status == "failed" and error:
+                st.caption(error)
+        
+        if counts.get("failed") and st.button("🔁 Retry Failed"):
+            write_queue.retry_failed()
+            st.rerun()
+
+def show_sheets_metrics():
+    """Show Sheets API usage in the sidebar (admin panel)"""
+    if not SHOW_SHEETS_METRICS:
+        return
+    
+    metrics = get_sheets_metrics()
+    calls = st.session_state.get("rerun_sheets_calls", [])
+    with st.sidebar:
+        st.subheader("📊 Sheets API Usage")
+        setup = st.session_state.get("script_setup_seconds", 0)
+        st.caption(f"Script setup: {setup * 1000:.0f} ms (budget {STARTUP_TIME_BUDGET * 1000:.0f} ms)")
+        if setup > STARTUP_TIME_BUDGET:
+            st.warning("⚠️ Script setup is over its time budget")
+        st.caption(f"This rerun: {len(calls)} call(s) • {sum(seconds for _, seconds in calls):.2f}s")
+        
+        limiter = get_sheets_limiter()
+        if limiter:
+            scheduler = limiter.stats()
+            st.caption(f"Scheduler: {scheduler['tokens']:.1f} token(s) free • "
+                       f"{scheduler['quota_pauses']} quota pause(s) • max wait {scheduler['max_wait_seconds']:.2f}s")
+            for name, values in scheduler["priorities"].items():
+                st.text(f"{name}: {values['waiting']} waiting, {values['granted']} sent, "
+                        f"{values['wait_seconds']:.1f}s waited")
+        for function, count in Counter(function for function, _ in calls).most_common():
+            st.text(f"{function}: {count}")
+        
+        rows = metrics.rows()
+        if rows:
+            import pandas as pd
+            st.caption(f"Since {metrics.started_at.strftime('%Y-%m-%d %H:%M:%S')}")
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("JSON", data=metrics.to_json(limiter), file_name="sheets_metrics.json",
+                               mime="application/json", use_container_width=True)
+        with col2:
+            st.download_button("Prometheus", data=metrics.to_prometheus() + (limiter.to_prometheus() if limiter else ""),
+                               file_name="sheets_metrics.prom",
+                               mime="text/plain", use_container_width=True)
+        if st.button("Reset Metrics", use_container_width=True):
+            metrics.reset()
+            st.rerun()
+
 # ============================
 # PAGE: HOME
 # ============================
@@ -292,7 +3321,7 @@ def show_home_page():
     st.markdown("### Welcome to the Student Management Portal")
     
     # Check connection
-    if not gc:
+    if not get_repository():
         st.error("⚠️ Not connected to Google Sheets. Please check your configuration.")
         st.info("Make sure to:")
         st.info("1. Add your Google Service Account credentials to Streamlit secrets")
@@ -300,26 +3329,42 @@ def show_home_page():
         st.info("3. Share your Google Sheets with the service account email")
     
     # Quick stats
-    if gc:
+    snapshot = None
+    if get_repository():
         try:
-            batches = get_all_batches()
-            students = get_all_students()
+            snapshot = load_roster_snapshot()
+            stats = snapshot.stats
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total Batches", len(batches))
+                st.metric("Total Batches", stats["total_batches"])
             with col2:
-                st.metric("Total Students", len(students))
+                st.metric("Total Students", stats["total_students"])
             with col3:
-                ielts_count = len([b for b in batches if b["type"] == "IELTS"])
-                st.metric("IELTS Batches", ielts_count)
-        except:
+                if st.button("🔄 Refresh", use_container_width=True):
+                    invalidate_sheet_cache()
+                    invalidate_roster_snapshot()
+                    st.rerun()
+                st.caption(f"Last refreshed: {snapshot.refreshed_at.strftime('%Y-%m-%d %H:%M:%S')}")
+                st.caption(f"Storage: {get_repository().name}")
+                replica = get_replica()
+                if replica:
+                    st.caption(f"Local replica synced: {replica.last_sync() or 'pending'}")
+            
+            type_cols = st.columns(len(BATCH_TYPES) * 2)
+            for i, batch_type in enumerate(BATCH_TYPES):
+                with type_cols[i * 2]:
+                    st.metric(f"{batch_type} Batches", stats["batches_by_type"][batch_type])
+                with type_cols[i * 2 + 1]:
+                    st.metric(f"{batch_type} Students", stats["students_by_type"][batch_type])
+        except Exception:
+            # Not a bare except: st.rerun() raises a BaseException that must get through
             pass
     
     st.markdown("---")
     
     # Main options
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
     
     with col1:
         if st.button("📁 Create Batch", use_container_width=True):
@@ -336,19 +3381,36 @@ def show_home_page():
             st.session_state.page = 'Find Student'
             st.rerun()
     
+    with col4:
+        if st.button("📤 Bulk Import", use_container_width=True):
+            st.session_state.page = 'Bulk Import'
+            st.rerun()
+    
+    with col5:
+        if st.button("🖨️ Rosters", use_container_width=True):
+            st.session_state.page = 'Rosters'
+            st.rerun()
+    
+    with col6:
+        if st.button("📊 Analytics", use_container_width=True):
+            st.session_state.page = 'Analytics'
+            st.rerun()
+    
+    with col7:
+        if st.button("🗄️ Archive", use_container_width=True):
+            st.session_state.page = 'Archive'
+            st.rerun()
+    
     # Recent activity
-    if gc:
+    if snapshot:
         st.markdown("---")
         st.subheader("📋 Recent Batches")
-        batches = get_all_batches()
+        batches = snapshot.batches
         if batches:
             recent_batches = batches[-5:]  # Show last 5 batches
             for batch in recent_batches:
-                try:
-                    student_count = len(get_all_students(batch["name"]))
-                    st.text(f"• {batch['name']} ({batch['type']}) - {student_count} students")
-                except:
-                    st.text(f"• {batch['name']} ({batch['type']})")
+                student_count = snapshot.stats["students_by_batch"].get(batch["name"], 0)
+                st.text(f"• {batch['name']} ({batch['type']}) - {student_count} students")
 
 # ============================
 # PAGE: CREATE BATCH
@@ -358,10 +3420,16 @@ def show_create_batch_page():
     st.title("📁 Create New Batch")
     show_navigation()
     
-    if not gc:
+    if not get_repository():
         st.error("⚠️ Not connected to Google Sheets")
         return
     
+    mode = st.radio("Create", ["Single batch", "Whole term"], horizontal=True,
+                    help="A whole term creates one batch for every Type and Time slot")
+    if mode == "Whole term":
+        show_create_term_form()
+        return
+    
     with st.form("create_batch_form"):
         st.subheader("Batch Information")
         
@@ -430,6 +3498,46 @@ def show_create_batch_page():
         if reset_button:
             st.rerun()
 
+def show_create_term_form():
+    """Form that creates every Type x Time slot batch for a year at once"""
+    with st.form("create_term_form"):
+        st.subheader("Term Information")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            year = st.selectbox("Year*", range(2023, 2031), index=2)
+            label = st.text_input("Term Label", placeholder="e.g., Spring",
+                                  help="Optional, added to every batch name")
+        
+        with col2:
+            batch_types = st.multiselect("Types*", ["IELTS", "Aptis"], default=["IELTS", "Aptis"])
+            time_slots = st.multiselect("Times*", ["4pm", "6pm"], default=["4pm", "6pm"])
+        
+        names_by_type = term_batch_names(year, batch_types, time_slots, label.strip())
+        existing_batches = set(get_batch_names())
+        new_names = {batch_type: [name for name in names if name not in existing_batches]
+                     for batch_type, names in names_by_type.items()}
+        skipped = [name for names in names_by_type.values() for name in names if name in existing_batches]
+        
+        submit_button = st.form_submit_button("🚀 Create Term", type="primary")
+        
+        if submit_button:
+            if not batch_types or not time_slots:
+                st.error("Please choose at least one Type and one Time")
+                return
+            
+            if skipped:
+                st.warning(f"Skipping existing batches: {', '.join(skipped)}")
+            
+            with st.spinner("Creating batches..."):
+                created = create_term_batches(new_names)
+            
+            if created:
+                st.success(f"✅ Created {len(created)} batch(es): {', '.join(created)}")
+            elif not skipped:
+                st.error("No batches were created")
+
 # ============================
 # PAGE: ADD STUDENT
 # ============================
@@ -438,7 +3546,7 @@ def show_add_student_page():
     st.title("➕ Add Student Information")
     show_navigation()
     
-    if not gc:
+    if not get_repository():
         st.error("⚠️ Not connected to Google Sheets")
         return
     
@@ -525,15 +3633,270 @@ def show_add_student_page():
         if reset_button:
             st.rerun()
 
+# ============================
+# PAGE: BULK IMPORT
+# ============================
+def show_bulk_import_page():
+    """Display bulk import page"""
+    import pandas as pd
+    
+    st.title("📤 Bulk Import Students")
+    show_navigation()
+    
+    if not get_repository():
+        st.error("⚠️ Not connected to Google Sheets")
+        return
+    
+    st.markdown(
+        f"Upload a CSV or Excel file with the columns **{', '.join(IMPORT_REQUIRED_COLUMNS)}** "
+        "and optionally **Year**. Each row is added to the batch named in its Batch column."
+    )
+    
+    uploaded_file = st.file_uploader("Student file*", type=["csv", "xlsx", "xls"])
+    if not uploaded_file:
+        return
+    
+    try:
+        df = read_student_file(uploaded_file)
+        valid, report = validate_student_rows(df, get_all_batches(), load_roster_snapshot(), get_write_queue())
+    except Exception as e:
+        st.error(f"❌ Could not read file: {str(e)}")
+        return
+    
+    invalid_count = len(report) - len(valid)
+    st.info(f"{len(valid)} valid row(s), {invalid_count} invalid row(s)")
+    if invalid_count:
+        st.dataframe(
+            pd.DataFrame([result for result in report if result["Status"] == "Invalid"]),
+            use_container_width=True
+        )
+    
+    if st.button("🚀 Import Now", type="primary", disabled=not valid):
+        with st.spinner(f"Importing {len(valid)} student(s)..."):
+            report = import_students(df)
+        
+        added = len([result for result in report if result["Status"] == "Added"])
+        failed = len([result for result in report if result["Status"] == "Failed"])
+        if added:
+            st.success(f"✅ {added} student(s) imported successfully!")
+        if failed:
+            st.error(f"❌ {failed} student(s) could not be written. See the report below.")
+        
+        report_df = pd.DataFrame(report)
+        st.dataframe(report_df, use_container_width=True)
+        st.download_button(
+            label="Download Report",
+            data=report_df.to_csv(index=False),
+            file_name=f"import_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv"
+        )
+
+# ============================
+# PAGE: ANALYTICS
+# ============================
+def show_analytics_page():
+    """Display enrollment analytics from the snapshot's aggregates"""
+    st.title("📊 Analytics")
+    show_navigation()
+    
+    if not get_repository():
+        st.error("⚠️ Not connected to Google Sheets")
+        return
+    
+    import pandas as pd
+    
+    # Every chart reads precomputed counts; nothing here scans the students
+    snapshot = load_roster_snapshot()
+    stats = snapshot.aggregates()
+    
+    if not stats["total_students"]:
+        st.info("No students found in the system.")
+        return
+    
+    by_month = sorted(stats["students_by_month"].items())
+    this_month = datetime.now().strftime("%Y-%m")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Students", stats["total_students"])
+    with col2:
+        st.metric("Total Batches", stats["total_batches"])
+    with col3:
+        st.metric("Enrolled This Month", stats["students_by_month"].get(this_month, 0))
+    
+    def counts_frame(counts, label):
+        return pd.DataFrame(sorted(counts.items()), columns=[label, "Students"]).set_index(label)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("By Type")
+        st.bar_chart(counts_frame(stats["students_by_type"], "Type"))
+        st.subheader("By Time Slot")
+        st.bar_chart(counts_frame(stats["students_by_time"], "Time"))
+    with col2:
+        st.subheader("By Year")
+        st.bar_chart(counts_frame(stats["students_by_year"], "Year"))
+        st.subheader("By Batch")
+        st.bar_chart(counts_frame(stats["students_by_batch"], "Batch"), horizontal=True)
+    
+    st.subheader("📈 Growth")
+    if by_month:
+        growth = pd.DataFrame(by_month, columns=["Month", "New Students"]).set_index("Month")
+        growth["Total Students"] = growth["New Students"].cumsum()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.bar_chart(growth["New Students"])
+        with col2:
+            st.line_chart(growth["Total Students"])
+    else:
+        st.info("No Created Date values to chart yet.")
+    
+    st.caption(f"Data as of {snapshot.refreshed_at.strftime('%Y-%m-%d %H:%M:%S')}, plus changes made since")
+
+# ============================
+# PAGE: ROSTERS
+# ============================
+def show_rosters_page():
+    """Display roster and attendance sheet printing page"""
+    st.title("🖨️ Rosters & Attendance Sheets")
+    show_navigation()
+    
+    if not get_repository():
+        st.error("⚠️ Not connected to Google Sheets")
+        return
+    
+    snapshot = load_roster_snapshot()
+    if not snapshot.batches:
+        st.warning("⚠️ No batches found. Please create a batch first.")
+        return
+    
+    kind_label = st.radio("Document", list(PDF_KINDS), horizontal=True, key="pdf_kind")
+    kind = PDF_KINDS[kind_label]
+    
+    # Single batch
+    st.subheader("Single Batch")
+    batch_name = st.selectbox("Select Batch", [batch["name"] for batch in snapshot.batches], key="pdf_batch")
+    st.download_button(
+        label=f"📄 Download {kind_label}",
+        # Only rendered once the button is clicked
+        data=lambda: batch_pdf(snapshot, kind, batch_name),
+        file_name=f"{batch_name}_{kind}.pdf",
+        mime="application/pdf",
+        key="pdf_batch_download"
+    )
+    
+    # Every batch in one file
+    st.markdown("---")
+    st.subheader("All Batches")
+    if st.button(f"🖨️ Print All Batches ({len(snapshot.batches)})"):
+        with st.spinner("Rendering PDFs..."):
+            try:
+                st.session_state.all_batches_pdf = (kind, all_batches_pdf(snapshot, kind))
+            except Exception as e:
+                st.error(f"Error rendering PDFs: {str(e)}")
+    
+    printed = st.session_state.get("all_batches_pdf")
+    if printed and printed[0] == kind and os.path.exists(printed[1]):
+        with open(printed[1], "rb") as f:
+            st.download_button(
+                label=f"📥 Download All {kind_label}s",
+                data=f.read(),
+                file_name=f"all_batches_{kind}.pdf",
+                mime="application/pdf",
+                key="pdf_all_download"
+            )
+
+# ============================
+# PAGE: ARCHIVE
+# ============================
+def show_archive_page():
+    """Display archive page for moving finished batches out of live storage"""
+    st.title("🗄️ Archive")
+    show_navigation()
+    
+    if not get_repository():
+        st.error("⚠️ Not connected to Google Sheets")
+        return
+    
+    snapshot = load_roster_snapshot()
+    archive = get_archive()
+    
+    st.subheader("Archive Batches")
+    st.caption("Archived batches are saved to a compressed file on this server and removed from live storage. "
+               "Find Student can still search them.")
+    
+    mode = st.radio("Archive", ["By batch", "By year"], horizontal=True, key="archive_mode")
+    if mode == "By batch":
+        batch_names = st.multiselect("Batches", [batch["name"] for batch in snapshot.batches],
+                                     key="archive_batches")
+    else:
+        years = sorted(snapshot.stats["students_by_year"], key=str)
+        year = st.selectbox("Year", years, key="archive_year") if years else None
+        batch_names = batches_of_year(snapshot, year) if year is not None else []
+        st.caption(f"{len(batch_names)} batch(es) with only {year} students: {', '.join(batch_names) or 'none'}")
+    
+    students = sum(snapshot.stats["students_by_batch"].get(name, 0) for name in batch_names)
+    confirm = st.checkbox(f"Remove {len(batch_names)} batch(es) ({students} students) from live storage",
+                          key="archive_confirm")
+    if st.button("🗄️ Archive", type="primary", disabled=not batch_names or not confirm):
+        with st.spinner("Archiving batches..."):
+            archived = archive_batches(batch_names)
+        if archived:
+            st.success(f"✅ Archived {len(archived)} batch(es)")
+    
+    st.markdown("---")
+    st.subheader("Archived Batches")
+    archived_batches = archive.batches()
+    if not archived_batches:
+        st.info("No batches have been archived yet.")
+        return
+    
+    import pandas as pd
+    st.dataframe(pd.DataFrame(archived_batches, columns=["name", "type", "students", "archived_at"]).rename(
+                     columns={"name": "Batch", "type": "Type", "students": "Students", "archived_at": "Archived"}),
+                 use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected = st.selectbox("Download an archived batch", archived_batches,
+                                format_func=lambda batch: f"{batch['name']} ({batch['archived_at']})",
+                                key="archive_download_batch")
+    with col2:
+        def archive_file():
+            with open(selected["file"], "rb") as f:
+                return f.read()
+        
+        st.download_button("📥 Download", data=archive_file, file_name=os.path.basename(selected["file"]),
+                           use_container_width=True, key="archive_download")
+
 # ============================
 # PAGE: FIND STUDENT
 # ============================
+SORT_OPTIONS = ["Relevance", "Student Name", "Student ID", "Batch", "Time", "Year", "Last Updated"]
+
+def student_label(student):
+    """One-line description of a student for dropdowns"""
+    return f"{student.name} ({student.student_id}) - {student.batch}"
+
+def page_of_students(students, sort_by, descending, page, page_size):
+    """One page of students in sort order, without sorting the whole list"""
+    end = page * page_size
+    if sort_by == "Relevance":
+        ordered = students[::-1] if descending else students
+        return ordered[end - page_size:end]
+    
+    def sort_key(student):
+        return str(student.get(sort_by, "")).lower()
+    
+    pick = heapq.nlargest if descending else heapq.nsmallest
+    return pick(end, students, key=sort_key)[end - page_size:]
+
 def show_find_student_page():
     """Display find student page with edit/delete functionality"""
     st.title("🔍 Find Student")
     show_navigation()
     
-    if not gc:
+    if not get_repository():
         st.error("⚠️ Not connected to Google Sheets")
         return
     
@@ -552,42 +3915,65 @@ def show_find_student_page():
                                    ["All Batches"] + get_batch_names(),
                                    key="batch_filter")
     
+    # Archived batches are only searched when asked for
+    archive = get_archive()
+    if search_query and archive.batches() and st.checkbox("Also search archived batches", key="search_archive"):
+        archived = archive.search(search_query)
+        with st.expander(f"🗄️ {len(archived)} archived match(es)", expanded=True):
+            if archived:
+                import pandas as pd
+                st.dataframe(pd.DataFrame([student.to_dict() for student in archived],
+                                          columns=['Student Name', 'Student ID', 'Contact', 'Email',
+                                                   'Batch', 'Type', 'Time', 'Year', 'Last Updated']),
+                             use_container_width=True, hide_index=True)
+    
     # Get all students
-    students = get_all_students()
+    snapshot = load_roster_snapshot()
     
-    if not students:
+    if not snapshot.records:
         st.info("No students found in the system.")
         return
     
-    # Convert to DataFrame for display
-    df = pd.DataFrame(students)
-    
-    # Apply filters
-    if search_query:
-        mask = (df['Student Name'].str.contains(search_query, case=False, na=False) | 
-                df['Student ID'].str.contains(search_query, case=False, na=False))
-        df = df[mask]
+    # Apply filters (search results come back ranked, best match first)
+    students = snapshot.search(search_query) if search_query else snapshot.students
     
     if batch_filter != "All Batches":
-        df = df[df['_batch_name'] == batch_filter]
+        students = [student for student in students if student.batch_name == batch_filter]
     
     # Display results
-    if len(df) > 0:
-        st.success(f"Found {len(df)} student(s)")
+    if students:
+        st.success(f"Found {len(students)} student(s)")
+        
+        # Sorting and paging controls
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            sort_by = st.selectbox("Sort by", SORT_OPTIONS, key="results_sort")
+        with col2:
+            descending = st.selectbox("Order", ["Ascending", "Descending"], key="results_order") == "Descending"
+        with col3:
+            page_size = st.selectbox("Per page", [25, 50, 100], key="results_page_size")
+        
+        page_count = max(1, -(-len(students) // page_size))
+        
+        # Start from the first page whenever the result set changes
+        results_signature = (search_query, batch_filter, sort_by, descending, page_size, len(students))
+        if st.session_state.get("results_signature") != results_signature:
+            st.session_state.results_signature = results_signature
+            st.session_state.results_page = 1
+        
+        with col4:
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count,
+                                   step=1, key="results_page")
+        
+        # Only the visible page is sorted out, materialized and sent
+        page_students = page_of_students(students, sort_by, descending, page, page_size)
         
         # Display table (without internal columns)
+        import pandas as pd
         display_cols = ['Student Name', 'Student ID', 'Contact', 'Email', 
                        'Batch', 'Type', 'Time', 'Year', 'Last Updated']
+        display_df = pd.DataFrame([student.to_dict() for student in page_students], columns=display_cols)
         
-        # Filter to available columns
-        available_cols = [col for col in display_cols if col in df.columns]
-        display_df = df[available_cols]
-        
-        # Create selection
-        if 'selected_index' not in st.session_state:
-            st.session_state.selected_index = 0
-        
-        # Display with selection
         st.dataframe(
             display_df,
             use_container_width=True,
@@ -597,71 +3983,76 @@ def show_find_student_page():
         # Student selection for editing
         st.subheader("📝 Student Actions")
         
-        if len(df) > 0:
-            student_options = [f"{row['Student Name']} ({row['Student ID']}) - {row['Batch']}" 
-                              for _, row in df.iterrows()]
+        selected_key = st.selectbox(
+            "Select a student to edit/delete:",
+            [student.key for student in page_students],
+            format_func=lambda key: student_label(snapshot.records[key]) if key in snapshot.records else "",
+            key="student_selector"
+        )
+        
+        # Get selected student data
+        selected_row = snapshot.records.get(selected_key)
+        if selected_row:
+            # Action buttons
+            col1, col2, col3 = st.columns(3)
             
-            selected_student = st.selectbox(
-                "Select a student to edit/delete:",
-                student_options,
-                key="student_selector"
-            )
+            with col1:
+                if st.button("➕ Add New Student", use_container_width=True):
+                    st.session_state.page = 'Add Student'
+                    st.rerun()
             
-            # Get selected student data
-            if selected_student:
-                selected_idx = student_options.index(selected_student)
-                selected_row = df.iloc[selected_idx]
-                
-                # Action buttons
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    if st.button("➕ Add New Student", use_container_width=True):
-                        st.session_state.page = 'Add Student'
-                        st.rerun()
-                
-                with col2:
-                    if st.button("✏️ Edit Selected", type="secondary", use_container_width=True):
-                        st.session_state.selected_student = selected_row.to_dict()
-                        st.session_state.edit_mode = True
-                        st.session_state.page = 'Edit Student'
-                        st.rerun()
-                
-                with col3:
-                    if st.button("🗑️ Delete Selected", type="secondary", use_container_width=True):
-                        # Confirm deletion
-                        st.warning(f"Are you sure you want to delete {selected_row['Student Name']}?")
-                        
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if st.button("✅ Yes, Delete", type="primary"):
-                                success = delete_student(
-                                    selected_row['_row'],
-                                    selected_row['_worksheet']
-                                )
-                                if success:
-                                    st.success(f"✅ Student '{selected_row['Student Name']}' deleted successfully!")
-                                    time.sleep(2)
-                                    st.rerun()
-                        with col2:
-                            if st.button("❌ Cancel"):
+            with col2:
+                if st.button("✏️ Edit Selected", type="secondary", use_container_width=True):
+                    # A detached copy; the worksheet is looked up again when saving
+                    st.session_state.selected_student = replace(selected_row)
+                    st.session_state.selected_version = snapshot.row_index.version(selected_row.batch_name)
+                    st.session_state.edit_mode = True
+                    st.session_state.page = 'Edit Student'
+                    st.rerun()
+            
+            with col3:
+                if st.button("🗑️ Delete Selected", type="secondary", use_container_width=True):
+                    # Confirm deletion
+                    st.warning(f"Are you sure you want to delete {selected_row.name}?")
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if st.button("✅ Yes, Delete", type="primary"):
+                            success = delete_student(
+                                selected_row.row,
+                                selected_row.batch_name,
+                                selected_row.student_id,
+                                snapshot.row_index.version(selected_row.batch_name)
+                            )
+                            if success:
+                                st.success(f"✅ Student '{selected_row.name}' deleted successfully!")
+                                time.sleep(2)
                                 st.rerun()
-                
-                with col4:
-                    if st.button("📥 Export Data", use_container_width=True):
-                        csv = display_df.to_csv(index=False)
-                        st.download_button(
-                            label="Download CSV",
-                            data=csv,
-                            file_name=f"students_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv",
-                            key="export_csv"
-                        )
-        else:
-            st.info("No students match your search criteria.")
-            if st.button("➕ Add New Student"):
-                st.session_state.page = 'Add Student'
-                st.rerun()
+                    with col2:
+                        if st.button("❌ Cancel"):
+                            st.rerun()
+            
+        
+        # Export every matching student, not just the visible page
+        st.subheader("📥 Export")
+        
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            export_format = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+        with col2:
+            extension, mime = EXPORT_FORMATS[export_format][:2]
+            if export_available(export_format):
+                rows, cache_key = export_source(snapshot, students, search_query, batch_filter)
+                st.download_button(
+                    label=f"Download {len(students)} student(s) as {export_format}",
+                    # Only generated once the button is clicked
+                    data=lambda: export_bytes(rows, export_format, cache_key),
+                    file_name=f"students_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                    mime=mime,
+                    key="export_download"
+                )
+            else:
+                st.warning(f"{export_format} export needs the '{EXPORT_FORMATS[export_format][3]}' package")
     
     else:
         st.info("No students found matching your criteria.")
@@ -743,9 +4134,11 @@ def show_edit_student_page():
             # Update student
             with st.spinner("Saving changes..."):
                 success = update_student(
-                    student['_row'],
-                    student['_worksheet'],
-                    updated_data
+                    student.row,
+                    student.batch_name,
+                    updated_data,
+                    student.student_id,
+                    st.session_state.get('selected_version')
                 )
                 
                 if success:
@@ -770,8 +4163,10 @@ def show_edit_student_page():
             with col1:
                 if st.button("✅ Yes, Delete", type="primary"):
                     success = delete_student(
-                        student['_row'],
-                        student['_worksheet']
+                        student.row,
+                        student.batch_name,
+                        student.student_id,
+                        st.session_state.get('selected_version')
                     )
                     if success:
                         st.success(f"✅ Student deleted successfully!")
@@ -790,6 +4185,12 @@ def show_edit_student_page():
 def main():
     """Main application router"""
     
+    # Imports on a cold start, module setup on later reruns
+    st.session_state.script_setup_seconds = time.perf_counter() - _script_started
+    
+    # Sheets calls are tallied per rerun for the metrics panel
+    st.session_state.rerun_sheets_calls = []
+    
     # Route to correct page
     if st.session_state.page == 'Home':
         show_home_page()
@@ -799,11 +4200,22 @@ def main():
         show_add_student_page()
     elif st.session_state.page == 'Find Student':
         show_find_student_page()
+    elif st.session_state.page == 'Bulk Import':
+        show_bulk_import_page()
+    elif st.session_state.page == 'Rosters':
+        show_rosters_page()
+    elif st.session_state.page == 'Analytics':
+        show_analytics_page()
+    elif st.session_state.page == 'Archive':
+        show_archive_page()
     elif st.session_state.page == 'Edit Student':
         show_edit_student_page()
     else:
         show_home_page()
     
+    show_write_queue_status()
+    show_sheets_metrics()
+    
     # Footer
     st.markdown("---")
     st.markdown(
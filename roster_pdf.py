@@ -0,0 +1,105 @@
+"""
+Roster and attendance sheet PDFs for a single batch.
+
+This module does not import Streamlit, so the print-all mode can render
+batches in worker processes.
+"""
+
+from datetime import datetime
+import io
+
+from fpdf import FPDF
+from pypdf import PdfWriter
+
+# ============================
+# CONSTANTS
+# ============================
+# Column title and width (mm) of every roster column, on A4 portrait
+ROSTER_COLUMNS = [("#", 10), ("Student Name", 62), ("Student ID", 30), ("Contact", 33), ("Email", 55)]
+
+# Attendance sheets have a tick box per session, on A4 landscape
+ATTENDANCE_COLUMNS = [("#", 10), ("Student Name", 62), ("Student ID", 30)]
+ATTENDANCE_SESSIONS = 12
+
+ROW_HEIGHT = 8
+
+# ============================
+# RENDERING
+# ============================
+def _text(value):
+    """Cell text in the core fonts' Latin-1 character set"""
+    return str(value if value is not None else "").encode("latin-1", "replace").decode("latin-1")
+
+def _start_document(title, batch, orientation):
+    """New PDF with the batch heading on its first page"""
+    pdf = FPDF(orientation=orientation, format="A4")
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 10, _text(f"{title}: {batch['name']}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", "", 10)
+    details = [f"Type: {batch['type']}", f"Students: {batch['students']}"]
+    if batch.get("time"):
+        details.append(f"Time: {batch['time']}")
+    if batch.get("year"):
+        details.append(f"Year: {batch['year']}")
+    details.append(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    pdf.cell(0, 6, _text("   ".join(details)), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    return pdf
+
+def _table_header(pdf, columns):
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.set_fill_color(230, 230, 230)
+    for title, width in columns:
+        pdf.cell(width, ROW_HEIGHT, _text(title), border=1, fill=True)
+    pdf.ln()
+    pdf.set_font("Helvetica", "", 9)
+
+def _table_row(pdf, columns, values):
+    # Repeat the header at the top of every new page
+    if pdf.will_page_break(ROW_HEIGHT):
+        pdf.add_page()
+        _table_header(pdf, columns)
+    for (_, width), value in zip(columns, values):
+        pdf.cell(width, ROW_HEIGHT, _text(value), border=1)
+    pdf.ln()
+
+def render_roster(batch, rows):
+    """Class list with contact details, one row per student"""
+    pdf = _start_document("Roster", batch, "P")
+    _table_header(pdf, ROSTER_COLUMNS)
+    for number, (name, student_id, contact, email) in enumerate(rows, start=1):
+        _table_row(pdf, ROSTER_COLUMNS, [number, name, student_id, contact, email])
+    return pdf
+
+def render_attendance(batch, rows):
+    """Sign-in sheet with an empty box per student and session"""
+    pdf = _start_document("Attendance", batch, "L")
+    session_width = (pdf.epw - sum(width for _, width in ATTENDANCE_COLUMNS)) / ATTENDANCE_SESSIONS
+    columns = ATTENDANCE_COLUMNS + [(str(session), session_width) for session in range(1, ATTENDANCE_SESSIONS + 1)]
+
+    _table_header(pdf, columns)
+    for number, (name, student_id, _, _) in enumerate(rows, start=1):
+        _table_row(pdf, columns, [number, name, student_id] + [""] * ATTENDANCE_SESSIONS)
+    return pdf
+
+RENDERERS = {"roster": render_roster, "attendance": render_attendance}
+
+def render_batch(kind, batch, rows):
+    """PDF bytes for one batch
+
+    batch is a dict with name, type, students and optionally time and year;
+    rows are (name, student ID, contact, email) tuples in print order.
+    """
+    return bytes(RENDERERS[kind](batch, rows).output())
+
+def merge_pdfs(paths):
+    """Concatenate PDF files into one document and return its bytes"""
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
@@ -0,0 +1,375 @@
+"""
+Command line and local HTTP JSON API over the app's student functions.
+
+    python student_api.py batches
+    python student_api.py students --batch IELTS_2025_Batch1 --search rahim
+    python student_api.py add IELTS_2025_Batch1 --name "Rahim Uddin" --student-id S1001 \\
+        --contact 01700000000 --email rahim@example.com --time 4pm --year 2025
+    python student_api.py update IELTS_2025_Batch1 5 --set Contact=01800000000 --student-id S1001
+    python student_api.py delete IELTS_2025_Batch1 5 --student-id S1001
+    python student_api.py serve --port 8502
+
+Both go through the same functions, roster snapshot and caches as the
+Streamlit pages, without a script rerun per request. The server listens on
+localhost only and has no authentication.
+
+    GET    /batches                      all batches
+    GET    /students?batch=&q=&limit=&offset=
+                                         students, best match first when q is given
+    POST   /students                     add one student, or a list of them
+    PATCH  /students/<batch>/<row>       {"changes": {...}, "student_id": ..., "version": ...}
+    DELETE /students/<batch>/<row>?student_id=&version=
+    POST   /batch                        {"operations": [{"op": "add" | "update" | "delete", ...}]}
+
+GET responses carry an ETag that changes with the roster data, and answer
+If-None-Match with 304 Not Modified. Updates and deletes need the student_id
+of the student at the row, and are refused if the sheet's row holds someone
+else. Students carry the "_version" of their batch's row numbering; passing
+it back with a write makes the app look the student up again by ID if rows
+have shifted since.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import logging
+import sys
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Bare-mode Streamlit warns on every call
+logging.disable(logging.WARNING)
+
+import newstudentmanagement as app
+
+# ============================
+# CONSTANTS
+# ============================
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+
+# Largest page of students a GET returns
+MAX_PAGE_SIZE = 1000
+
+# Keys of the student objects accepted by add, as used by the Add Student form
+STUDENT_FIELDS = ["name", "student_id", "contact", "email", "time", "year"]
+
+# Import file column of each student field, for validate_student_rows()
+IMPORT_COLUMNS = {"Student Name": "name", "Student ID": "student_id", "Contact": "contact",
+                  "Email": "email", "Time": "time", "Year": "year"}
+
+# ============================
+# CALLING THE APP
+# ============================
+# The app reports problems with st.error/st.warning; collect them per
+# thread instead of drawing them
+_messages = threading.local()
+
+def _collector(level, show):
+    def collect(body, *args, **kwargs):
+        collected = getattr(_messages, "collected", None)
+        if collected is None:
+            return show(body, *args, **kwargs)
+        collected.append((level, str(body).lstrip("❌⚠️🕒 ")))
+    return collect
+
+for _level in ("error", "warning", "info"):
+    setattr(app.st, _level, _collector(_level, getattr(app.st, _level)))
+
+def call_app(function, *args):
+    """Run an app function; returns (result, {"errors": [...], "warnings": [...], "info": [...]})"""
+    _messages.collected = []
+    try:
+        result = function(*args)
+    finally:
+        collected, _messages.collected = _messages.collected, None
+    messages = {"errors": [], "warnings": [], "info": []}
+    for level, text in collected:
+        messages["errors" if level == "error" else "warnings" if level == "warning" else "info"].append(text)
+    return result, messages
+
+def rejected(*errors):
+    """The (result, messages) of a write refused before reaching the app"""
+    return False, {"errors": list(errors), "warnings": [], "info": []}
+
+def _whole_number(value, name, required=True):
+    """value as an int; raises ValueError naming the field when it is not one"""
+    if value is None and not required:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{name} must be a whole number")
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number") from None
+
+def student_json(student, snapshot):
+    """JSON object of a student: worksheet columns plus where it lives"""
+    return {**student.to_dict(), "_batch": student.batch_name, "_type": student.batch_type, "_row": student.row,
+            "_version": snapshot.row_index.version(student.batch_name)}
+
+def list_batches():
+    snapshot = app.load_roster_snapshot()
+    counts = snapshot.stats["students_by_batch"]
+    return [{"name": batch["name"], "type": batch["type"], "students": counts.get(batch["name"], 0)}
+            for batch in snapshot.batches]
+
+def list_students(batch=None, query=None, limit=None, offset=0):
+    """{"total": n, "students": [...]} for one page of matching students"""
+    snapshot = app.load_roster_snapshot()
+    students = snapshot.search(query) if query else snapshot.students
+    if batch:
+        students = [student for student in students if student.batch_name == batch]
+    limit = min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    return {"total": len(students),
+            "students": [student_json(student, snapshot) for student in students[offset:offset + limit]]}
+
+def add_student(batch, student):
+    if not isinstance(student, dict):
+        return rejected("A student must be a JSON object")
+    missing = [field for field in STUDENT_FIELDS if field not in student]
+    if missing:
+        return rejected(f"Missing field(s): {', '.join(missing)}")
+    
+    # Same rules as a bulk import: required fields, email format, time slot
+    import pandas as pd
+    row = {header: student[field] for header, field in IMPORT_COLUMNS.items()}
+    valid, report = app.validate_student_rows(pd.DataFrame([{**row, "Batch": batch}]),
+                                              app.load_roster_snapshot().batches)
+    if not valid:
+        return rejected(report[0]["Message"])
+    return call_app(app.add_student_to_batch, {field: student[field] for field in STUDENT_FIELDS}, batch)
+
+def update_student(batch, row, changes, student_id=None, version=None):
+    if not isinstance(changes, dict):
+        return rejected("changes must be a JSON object")
+    unknown = [header for header in changes if header not in app.EDITABLE_FIELDS]
+    if unknown:
+        return rejected(f"Not editable: {', '.join(unknown)}")
+    return call_app(app.update_student, row, batch, changes, student_id, version)
+
+def delete_student(batch, row, student_id=None, version=None):
+    return call_app(app.delete_student, row, batch, student_id, version)
+
+def run_operation(operation):
+    """Apply one {"op": ...} write and describe its outcome"""
+    if not isinstance(operation, dict):
+        ok, messages = rejected("An operation must be a JSON object")
+        return {"ok": ok, **messages}
+    
+    op = operation.get("op")
+    try:
+        if op in ("update", "delete"):
+            row = _whole_number(operation.get("row"), "row")
+            if row < 2:
+                raise ValueError("row must be 2 or more; row 1 is the header")
+            # Never write to a bare row number: rows shift as students are deleted
+            if operation.get("student_id") in (None, ""):
+                raise ValueError("student_id of the student at that row is required")
+            version = _whole_number(operation.get("version"), "version", required=False)
+        if op == "add":
+            ok, messages = add_student(operation.get("batch"), operation.get("student", {}))
+        elif op == "update":
+            ok, messages = update_student(operation.get("batch"), row, operation.get("changes", {}),
+                                          operation.get("student_id"), version)
+        elif op == "delete":
+            ok, messages = delete_student(operation.get("batch"), row, operation.get("student_id"), version)
+        else:
+            ok, messages = rejected(f"Unknown op: {op!r}")
+    except ValueError as e:
+        ok, messages = rejected(str(e))
+    return {"ok": bool(ok), **messages}
+
+# ============================
+# HTTP API
+# ============================
+class StudentAPIHandler(BaseHTTPRequestHandler):
+    server_version = "StudentAPI/1.0"
+
+    def handle_one_request(self):
+        # Without a Streamlit session the rate limiter would treat every
+        # request as background work
+        with app.sheets_caller("API"):
+            super().handle_one_request()
+    
+    def _send(self, status, body=None, etag=None):
+        data = json.dumps(body, default=str).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null") if length else None
+
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return parts, params
+
+    def _write_result(self, result):
+        self._send(200 if result["ok"] else 400, result)
+
+    def do_GET(self):
+        parts, params = self._route()
+        if parts not in (["batches"], ["students"]):
+            return self._send(404, {"errors": ["Not found"]})
+
+        # The snapshot's data key changes with every reload and every write
+        snapshot = app.load_roster_snapshot()
+        etag = '"' + hashlib.sha1(repr((snapshot.data_key, parts, sorted(params.items()))).encode()).hexdigest() + '"'
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            return self._send(304, etag=etag)
+
+        if parts == ["batches"]:
+            return self._send(200, list_batches(), etag)
+        try:
+            body = list_students(params.get("batch"), params.get("q"),
+                                 int(params["limit"]) if "limit" in params else None, int(params.get("offset", 0)))
+        except ValueError:
+            return self._send(400, {"errors": ["limit and offset must be numbers"]})
+        self._send(200, body, etag)
+
+    def do_POST(self):
+        parts, _ = self._route()
+        try:
+            body = self._body()
+        except ValueError:
+            return self._send(400, {"errors": ["Body is not valid JSON"]})
+
+        if parts == ["students"]:
+            students = body if isinstance(body, list) else [body or {}]
+            results = [run_operation({"op": "add", "student": student,
+                                      "batch": student.get("batch") if isinstance(student, dict) else None})
+                       for student in students]
+            if isinstance(body, list):
+                return self._send(200, {"results": results})
+            return self._write_result(results[0])
+
+        if parts == ["batch"]:
+            operations = body.get("operations") if isinstance(body, dict) else None
+            if not isinstance(operations, list):
+                return self._send(400, {"errors": ['Body must be {"operations": [...]}']})
+            return self._send(200, {"results": [run_operation(operation) for operation in operations]})
+
+        self._send(404, {"errors": ["Not found"]})
+
+    def do_PATCH(self):
+        parts, _ = self._route()
+        if len(parts) != 3 or parts[0] != "students":
+            return self._send(404, {"errors": ["Not found"]})
+        try:
+            body = self._body() or {}
+        except ValueError:
+            return self._send(400, {"errors": ["Body is not valid JSON"]})
+        if not isinstance(body, dict):
+            return self._send(400, {"errors": ["Body must be a JSON object"]})
+        self._write_result(run_operation({**body, "op": "update", "batch": parts[1], "row": parts[2]}))
+
+    def do_DELETE(self):
+        parts, params = self._route()
+        if len(parts) != 3 or parts[0] != "students":
+            return self._send(404, {"errors": ["Not found"]})
+        self._write_result(run_operation({"op": "delete", "batch": parts[1], "row": parts[2],
+                                          "student_id": params.get("student_id"),
+                                          "version": params.get("version") or None}))
+
+    def log_message(self, format, *args):
+        # Keep the access log on stderr, as http.server does
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Serve the JSON API until interrupted"""
+    server = ThreadingHTTPServer((host, port), StudentAPIHandler)
+    print(f"Student API on http://{host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# ============================
+# COMMAND LINE
+# ============================
+def _print(value):
+    print(json.dumps(value, indent=2, default=str))
+
+def _changes(assignments):
+    """{header: value} from "Header=value" arguments"""
+    changes = {}
+    for assignment in assignments:
+        header, separator, value = assignment.partition("=")
+        if not separator:
+            raise SystemExit(f"--set expects Header=value, got {assignment!r}")
+        changes[header.strip()] = value
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("batches", help="list batches")
+
+    students = commands.add_parser("students", help="list or search students")
+    students.add_argument("--batch")
+    students.add_argument("--search")
+    students.add_argument("--limit", type=int)
+    students.add_argument("--offset", type=int, default=0)
+
+    add = commands.add_parser("add", help="add a student to a batch")
+    add.add_argument("batch")
+    for field in STUDENT_FIELDS:
+        add.add_argument(f"--{field.replace('_', '-')}", dest=field, required=True,
+                         type=int if field == "year" else str)
+
+    update = commands.add_parser("update", help="change a student's editable fields")
+    update.add_argument("batch")
+    update.add_argument("row", type=int)
+    update.add_argument("--set", action="append", default=[], metavar="HEADER=VALUE", help="e.g. Contact=017...")
+    update.add_argument("--student-id", required=True, help="Student ID expected at that row")
+
+    delete = commands.add_parser("delete", help="delete a student")
+    delete.add_argument("batch")
+    delete.add_argument("row", type=int)
+    delete.add_argument("--student-id", required=True, help="Student ID expected at that row")
+
+    server = commands.add_parser("serve", help="run the HTTP JSON API")
+    server.add_argument("--host", default=DEFAULT_HOST)
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        return serve(args.host, args.port)
+    with app.sheets_caller("CLI"):
+        run_command(args)
+
+def run_command(args):
+    """Run one CLI command other than serve and print its result"""
+    if args.command == "batches":
+        return _print(list_batches())
+    if args.command == "students":
+        return _print(list_students(args.batch, args.search, args.limit, args.offset))
+
+    if args.command == "add":
+        result = run_operation({"op": "add", "batch": args.batch,
+                                "student": {field: getattr(args, field) for field in STUDENT_FIELDS}})
+    elif args.command == "update":
+        result = run_operation({"op": "update", "batch": args.batch, "row": args.row,
+                                "changes": _changes(args.set), "student_id": args.student_id})
+    else:
+        result = run_operation({"op": "delete", "batch": args.batch, "row": args.row, "student_id": args.student_id})
+    _print(result)
+    if not result["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()